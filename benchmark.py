@@ -0,0 +1,388 @@
+import argparse
+import json
+import math
+import os
+import platform
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from src.batch import getRegrets, solveBatch
+from src.player import MeanFieldPlayer, PerfectInformationPlayer, RelaxedInformationPlayer
+from src.simulation import simulate
+from src.solver import AnalyticSolver, IterativeSolver, MemoizedSolver, RelaxedSolver
+from src.ticks import TickSolver
+from src.utils import equalRules, equalWeights, predictionGrid
+
+# Solvers benchmarked for each player type; None runs the players' own recursive predict
+# ("pruned" with the branch and bound of PerfectInformationPlayer)
+SOLVERS = {
+  "perfect": {"memoized": MemoizedSolver, "analytic": AnalyticSolver, "batched": solveBatch, "ticks": TickSolver, "iterative": IterativeSolver, "pruned": None, "recursive": None},
+  "relaxed": {"memoized": RelaxedSolver, "recursive": None}
+}
+
+def case_key(case):
+  key = f"{case['player_type']}/{case['solver']}/n={case['n']}/delta={case['delta']}/rule={case['rule']}"
+  if case["player_type"] == "relaxed":
+    key += f"/radius={case['radius']}"
+  return key
+
+def reference_key(case):
+  return case_key({**case, "solver": "recursive"})
+
+def build_cases(args):
+  cases = []
+  for player_type in args.player_type:
+    radii = args.radius if player_type == "relaxed" else [None]
+    for solver in SOLVERS[player_type]:
+      if args.solver and solver not in args.solver:
+        continue
+      for n in args.n:
+        for delta in args.delta:
+          for rule in args.rule:
+            for radius in radii:
+              cases.append({"player_type": player_type, "solver": solver, "n": n, "delta": delta, "rule": rule, "radius": radius})
+  return cases
+
+# Rough number of nested predict calls made by the recursive path
+def recursion_size(case):
+  gridSize = round(1 / case["delta"]) + 1
+  if case["player_type"] == "relaxed":
+    return gridSize * min(gridSize, 2 * case["radius"] + 1) ** (case["n"] - 2)
+  return gridSize ** (case["n"] - 1)
+
+def build_players(case, q, possiblePredictions):
+  n = case["n"]
+  weights = equalWeights(n)
+  rules = equalRules(n, case["rule"])
+
+  if case["player_type"] == "relaxed":
+    return [RelaxedInformationPlayer(i, weights[i], rules[i], q, possiblePredictions, case["radius"]) for i in range(n)]
+  return [PerfectInformationPlayer(i, weights[i], rules[i], q, possiblePredictions, case["solver"] == "pruned") for i in range(n)]
+
+# Solves every q in one call; there is no per-player predict time to report
+def run_batch_case(case, qValues, possiblePredictions):
+  n = case["n"]
+  weights = equalWeights(n)
+  rules = equalRules(n, case["rule"])
+  beliefs = np.tile(qValues, (n, 1))
+
+  start_time = time.perf_counter()
+  scores, predictions, _, _ = solveBatch(weights, rules, beliefs, qValues, possiblePredictions)
+  total = time.perf_counter() - start_time
+
+  return {"time": total, "predictTimes": [0] * n, "predictions": predictions.tolist(), "scores": scores.tolist()}
+
+def run_case(case, qValues, repeat):
+  solverClass = SOLVERS[case["player_type"]][case["solver"]]
+  possiblePredictions = predictionGrid(case["delta"])
+
+  best = None
+  for _ in range(repeat):
+    if solverClass is solveBatch:
+      result = run_batch_case(case, qValues, possiblePredictions)
+      if best is None or result["time"] < best["time"]:
+        best = result
+      continue
+
+    total = 0
+    predictTimes = [0] * case["n"]
+    predictions = []
+    scores = []
+
+    for q in qValues:
+      players = build_players(case, q, possiblePredictions)
+      timings = []
+
+      # Solvers that precompute in their constructor are timed with it
+      start_time = time.perf_counter()
+      solver = solverClass(players) if solverClass else None
+      result = simulate(players, q, solver, timings)
+      total += time.perf_counter() - start_time
+
+      predictTimes = [a + b for a, b in zip(predictTimes, timings)]
+      scores.append([float(score) for score in result[0]])
+      predictions.append([float(prediction) for prediction in result[1]])
+
+    if best is None or total < best["time"]:
+      best = {"time": total, "predictTimes": predictTimes, "predictions": predictions, "scores": scores}
+
+  return best
+
+# Error of MeanFieldPlayer against the exact solver on the same market, for each lookahead
+# Exact solves are timed with MemoizedSolver, so only small n are practical
+def approximation_report(args):
+  report = []
+  for n in args.n:
+    for delta in args.delta:
+      possiblePredictions = predictionGrid(delta)
+      for rule in args.rule:
+        weights = equalWeights(n)
+        rules = equalRules(n, rule)
+
+        exact = []
+        exactTime = 0
+        for q in args.q:
+          players = [PerfectInformationPlayer(i, weights[i], rules[i], q, possiblePredictions) for i in range(n)]
+          start_time = time.perf_counter()
+          exact.append(simulate(players, q, MemoizedSolver(players)))
+          exactTime += time.perf_counter() - start_time
+
+        for lookahead in args.lookahead:
+          approximate = []
+          approximateTime = 0
+          for q in args.q:
+            players = [MeanFieldPlayer(i, weights[i], rules[i], q, possiblePredictions, lookahead) for i in range(n)]
+            start_time = time.perf_counter()
+            approximate.append(simulate(players, q))
+            approximateTime += time.perf_counter() - start_time
+
+          regrets = getRegrets(weights, rules, np.tile(args.q, (n, 1)), [m[1] for m in approximate], possiblePredictions)
+          predictionErrors = [max(abs(a - b) for a, b in zip(e[1], m[1])) for e, m in zip(exact, approximate)]
+          scoreLosses = [max(a - b for a, b in zip(e[0], m[0])) for e, m in zip(exact, approximate)]
+          report.append({
+            "n": n,
+            "delta": delta,
+            "rule": rule,
+            "lookahead": lookahead,
+            "matchRate": sum(e[1] == m[1] for e, m in zip(exact, approximate)) / len(exact),
+            "predictionError": float(max(predictionErrors)),
+            "marketPredictionError": float(max(abs(e[3] - m[3]) for e, m in zip(exact, approximate))),
+            "scoreLoss": float(max(scoreLosses)),
+            "regret": regrets.max(axis=0).tolist(),
+            "exactTime": exactTime,
+            "time": approximateTime
+          })
+          case = report[-1]
+          print(f"n={n} delta={delta} rule={rule} lookahead={lookahead}: {case['matchRate']:.0%} exact, prediction error {case['predictionError']:.3f}, "
+                f"market error {case['marketPredictionError']:.4f}, score loss {case['scoreLoss']:.4f}, max regret {max(case['regret']):.4f}; {case['time']:.3f}s vs {case['exactTime']:.3f}s exact")
+  return report
+
+MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+# Small config launched by startup_report, as a scheduler would for small-n runs
+STARTUP_CONFIG = ["--n", "2", "--player_type", "perfect", "--delta", "0.1", "--deltaQ", "0.25", "--log_level", "WARNING"]
+
+def launch(arguments):
+  start_time = time.perf_counter()
+  subprocess.run([sys.executable, *arguments], stdout=subprocess.DEVNULL, check=True)
+  return time.perf_counter() - start_time
+
+# Startup cost of main.py in seconds, as the median of `runs` launches: the interpreter alone,
+# --help, importing the simulation and a small run. The same small runs are then sent to one
+# --serve process, whose total includes starting it
+def startup_report(runs):
+  os.makedirs("results", exist_ok=True)
+  outputs = [f"benchmark-startup-{k}" for k in range(runs)]
+  report = {
+    "python": statistics.median(launch(["-c", "pass"]) for _ in range(runs)),
+    "help": statistics.median(launch([MAIN, "--help"]) for _ in range(runs)),
+    "import": statistics.median(launch(["-c", "import runner"]) for _ in range(runs)),
+  }
+  runTimes = [launch([MAIN, *STARTUP_CONFIG, "--output", output]) for output in outputs]
+  report["run"] = statistics.median(runTimes)
+  report["runTotal"] = sum(runTimes)
+
+  start_time = time.perf_counter()
+  server = subprocess.Popen([sys.executable, MAIN, "--serve", "--log_level", "WARNING"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+  requestTimes = []
+  for output in outputs:
+    request_time = time.perf_counter()
+    server.stdin.write(shlex.join([*STARTUP_CONFIG, "--output", output]) + "\n")
+    server.stdin.flush()
+    response = json.loads(server.stdout.readline())
+    if "error" in response:
+      raise RuntimeError(f"serve request failed: {response['error']}")
+    requestTimes.append(time.perf_counter() - request_time)
+  server.stdin.close()
+  server.wait()
+  report["served"] = statistics.median(requestTimes)
+  report["serveTotal"] = time.perf_counter() - start_time
+
+  for output in outputs:
+    for suffix in [".json", ".jsonl"]:
+      os.remove(f"results/{output}{suffix}")
+  return report
+
+# Largest regret of each player over the solved q values of a PerfectInformationPlayer case
+# (see getRegrets), timed separately from the solve
+def check_equilibrium(case, qValues):
+  n = case["n"]
+  weights = equalWeights(n)
+  rules = equalRules(n, case["rule"])
+  beliefs = np.tile(qValues, (n, 1))
+
+  start_time = time.perf_counter()
+  regrets = getRegrets(weights, rules, beliefs, case["predictions"], predictionGrid(case["delta"]))
+  return {"regret": regrets.max(axis=0).tolist(), "regretTime": time.perf_counter() - start_time}
+
+def slope(xs, ys):
+  points = [(math.log(x), math.log(y)) for x, y in zip(xs, ys) if y > 0]
+  if len(points) < 2:
+    return None
+  return float(np.polyfit(*zip(*points), 1)[0])
+
+# How runtime grows with each parameter while the others stay fixed:
+# growth factor per extra player, and log-log slopes against grid size and radius subset size
+def scaling(results):
+  series = {"n": {}, "delta": {}, "radius": {}}
+  for case in results:
+    if "time" not in case:
+      continue
+    for parameter in series:
+      if case[parameter] is None:
+        continue
+      rest = case_key({**case, parameter: "*"})
+      series[parameter].setdefault(rest, []).append((case[parameter], case["time"]))
+
+  report = {}
+  for parameter, groups in series.items():
+    for rest, points in groups.items():
+      points.sort()
+      if len(points) < 2:
+        continue
+      if parameter == "n":
+        ratios = [b[1] / a[1] for a, b in zip(points, points[1:]) if a[1] > 0 and b[0] == a[0] + 1]
+        value = float(np.exp(np.mean(np.log(ratios)))) if ratios else None
+      elif parameter == "delta":
+        value = slope([round(1 / delta) + 1 for delta, _ in points], [t for _, t in points])
+      else:
+        value = slope([2 * radius + 1 for radius, _ in points], [t for _, t in points])
+      report.setdefault(parameter, {})[rest] = value
+  return report
+
+def compare(results, baseline, threshold, min_time):
+  stored = {case["key"]: case for case in baseline["cases"] if "time" in case}
+  regressions = []
+  mismatches = []
+
+  for case in results:
+    previous = stored.get(case["key"])
+    if previous is None or "time" not in case:
+      continue
+    if case["predictions"] != previous["predictions"]:
+      mismatches.append(case["key"])
+    if max(case["time"], previous["time"]) >= min_time and case["time"] > previous["time"] * (1 + threshold):
+      regressions.append((case["key"], previous["time"], case["time"]))
+
+  return regressions, mismatches
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the player solvers and compare against a stored baseline.")
+  parser.add_argument("--n", type=int, nargs="+", default=[2, 3, 4, 5, 6], help="Numbers of players")
+  parser.add_argument("--delta", type=float, nargs="+", default=[0.1, 0.05, 0.01], help="Prediction grid steps")
+  parser.add_argument("--player_type", type=str, nargs="+", choices=list(SOLVERS), default=list(SOLVERS), help="Player types")
+  parser.add_argument("--solver", type=str, nargs="+", help="Only run these solvers")
+  parser.add_argument("--radius", type=int, nargs="+", default=[1, 2, 5], help="Radii for RelaxedInformationPlayer")
+  parser.add_argument("--rule", type=str, nargs="+", choices=["brier", "log", "quadratic"], default=["brier", "log", "quadratic"], help="Scoring rules")
+  parser.add_argument("--q", type=float, nargs="+", default=[0.25, 0.5, 0.75], help="q values solved for every case")
+  parser.add_argument("--repeat", type=int, default=1, help="Runs per case; the fastest one is kept")
+  parser.add_argument("--max_recursion", type=float, default=1e5, help="Skip recursive cases with more nested predict calls than this")
+  parser.add_argument("--output", type=str, help="Write the results to this JSON file")
+  parser.add_argument("--baseline", type=str, help="Compare against a baseline written with --output")
+  parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression")
+  parser.add_argument("--lookahead", type=int, nargs="+", help="Only report the error of MeanFieldPlayer with these lookaheads against the exact solver")
+  parser.add_argument("--startup", type=int, metavar="RUNS", help="Only report the startup time of main.py, as the median of this many launches")
+  parser.add_argument("--min_time", type=float, default=0.05, help="Ignore regressions on cases faster than this many seconds")
+
+  args = parser.parse_args()
+
+  if args.startup:
+    report = startup_report(args.startup)
+    print(f"python {report['python']:.3f}s, main.py --help {report['help']:.3f}s, import runner {report['import']:.3f}s, small run {report['run']:.3f}s")
+    print(f"{args.startup} small runs: {report['runTotal']:.3f}s launched one by one, {report['serveTotal']:.3f}s through --serve ({report['served']:.3f}s per request)")
+    if args.output:
+      with open(args.output, "w") as output_file:
+        json.dump({"machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()}, "startup": report}, output_file, indent=2)
+
+    failed = False
+    if args.baseline:
+      with open(args.baseline, "r") as baseline_file:
+        baseline = json.load(baseline_file).get("startup", {})
+      regressions = [(key, baseline[key], report[key]) for key in report if key in baseline and report[key] > baseline[key] * (1 + args.threshold)]
+      print(f"\nCompared against {args.baseline}: {len(regressions)} regressions")
+      for key, previous, current in regressions:
+        print(f"  slower  {key:<60} {previous:.3f}s -> {current:.3f}s")
+      failed = bool(regressions)
+    sys.exit(1 if failed else 0)
+
+  if args.lookahead:
+    report = approximation_report(args)
+    if args.output:
+      with open(args.output, "w") as output_file:
+        json.dump({"q": args.q, "approximation": report}, output_file, indent=2)
+    sys.exit(0)
+
+  results = []
+  for case in build_cases(args):
+    case["key"] = case_key(case)
+    if case["solver"] == "recursive" and recursion_size(case) > args.max_recursion:
+      case["skipped"] = "recursion too large"
+      print(f"{case['key']:<60} skipped")
+    else:
+      case.update(run_case(case, args.q, args.repeat))
+      predictTimes = ", ".join(f"{t:.3f}" for t in case["predictTimes"])
+      regret = ""
+      if case["player_type"] == "perfect":
+        case.update(check_equilibrium(case, args.q))
+        regret = f"  max regret: {max(case['regret']):.2g} ({case['regretTime']:.3f}s)"
+      print(f"{case['key']:<60} {case['time']:9.3f}s  predict: [{predictTimes}]{regret}")
+    results.append(case)
+
+  # Every solver must agree with the recursive path wherever it was run
+  references = {case["key"]: case for case in results if case["solver"] == "recursive" and "time" in case}
+  incorrect = []
+  for case in results:
+    reference = references.get(reference_key(case))
+    if reference is not None and "time" in case:
+      case["correct"] = case["predictions"] == reference["predictions"]
+      if not case["correct"]:
+        incorrect.append(case["key"])
+
+  # Every PerfectInformationPlayer solution must be a subgame-perfect equilibrium
+  unstable = [case["key"] for case in results if max(case.get("regret", [0])) > 1e-12]
+
+  report = scaling(results)
+  print("\nScaling")
+  for parameter, label in [("n", "growth per extra player"), ("delta", "slope vs grid size"), ("radius", "slope vs radius subset")]:
+    for rest, value in report.get(parameter, {}).items():
+      if value is not None:
+        print(f"  {rest:<60} {label}: {value:.2f}")
+
+  if incorrect:
+    print("\nDiffers from the recursive path:")
+    for key in incorrect:
+      print(f"  {key}")
+
+  if unstable:
+    print("\nNot an equilibrium (positive regret):")
+    for key in unstable:
+      print(f"  {key}")
+
+  if args.output:
+    with open(args.output, "w") as output_file:
+      json.dump({
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()},
+        "q": args.q,
+        "cases": results,
+        "scaling": report
+      }, output_file, indent=2)
+
+  failed = bool(incorrect) or bool(unstable)
+  if args.baseline:
+    with open(args.baseline, "r") as baseline_file:
+      baseline = json.load(baseline_file)
+
+    regressions, mismatches = compare(results, baseline, args.threshold, args.min_time)
+    print(f"\nCompared against {args.baseline}: {len(regressions)} regressions, {len(mismatches)} prediction mismatches")
+    for key, previous, current in regressions:
+      print(f"  slower  {key:<60} {previous:.3f}s -> {current:.3f}s")
+    for key in mismatches:
+      print(f"  differs {key}")
+    failed = failed or bool(regressions) or bool(mismatches)
+
+  sys.exit(1 if failed else 0)
@@ -1,13 +1,26 @@
 import argparse
-import numpy as np
+import contextlib
+import itertools
+import json
+import logging
+import math
+import os
+import shlex
+import sys
 import time
 
-from src.rules import calculateScore
-from src.simulation import simulate
-from src.player import *
-from src.utils import equalRules, equalWeights
-from src.results import JSONResultHandler
-from src.noise import *
+# The command line only uses the standard library: the simulation (NumPy, the players and the
+# engine of the selected solver) is imported by run, so parsing the arguments and --help stay
+# fast. runner.py has the engine and the Python API (execute, simulate_iter, simulate_aiter)
+
+logger = logging.getLogger(__name__)
+
+PLAYER_TYPES = ["perfect", "relaxed", "meanfield", "average"]
+
+NOISE_FUNCTIONS = ["identity", "gaussian", "uniform", "sinusoidal", "exponential"]
+
+# Names of runner.SOLVERS and runner.BATCH_SOLVERS
+SOLVERS = ["memoized", "analytic", "ticks", "multires", "warm", "iterative", "recursive", "batched"]
 
 config = {
   "n": 4,
@@ -15,85 +28,213 @@ config = {
   "deltaQ": 0.05
 }
 
-def execute(config):
-  ts = int(time.time())
-
-  n = config["n"]
-  delta = config["delta"]
-  deltaQ = config["deltaQ"]
-  player_type = config["player_type"]
-  noise_function = config["noise_function"]
-  noise_delta = config["noise_delta"]
-  
-  # Should we add a config for weights, rules?
-  weights = equalWeights(n)
-  rules = equalRules(n, "brier")
-
-  qValues = np.arange(0, 1 + deltaQ, deltaQ).round(2).tolist()
-  possiblePredictions = np.arange(0, 1 + delta, delta).round(2).tolist()
-
-  json_result_handler = JSONResultHandler(ts)
-
-  print(f"Executing simulation...")
-  print(f"n = {n}; players = {player_type}; weights = {weights}; rules = {rules}; delta = {delta}; deltaQ = {deltaQ}")
-  print(f"noise_function = {noise_function}; noise_delta = {noise_delta};")
-
-  # store score predictions finalprediction and marketprediction list
-  scoresList = []
-  predictionsList = []
-  finalPredictionList = []
-  marketPredictionList = []
-  scoreList = []
-  for q in qValues:
-    players = []
-
-    # if p is defined here, all players have same beliefs
-    # p = get_noisy_q(q, noiseFn, 0.025)
-
-    if player_type == "relaxed":
-      players = [RelaxedInformationPlayer(i, weights[i], rules[i], get_noisy_q(q, noise_function, noise_delta), possiblePredictions, config["radius"]) for i in range(n)]
-    elif player_type == "perfect":
-      players = [PerfectInformationPlayer(i, weights[i], rules[i], get_noisy_q(q, noise_function, noise_delta), possiblePredictions) for i in range(n)]
-
-    print("Simulation step", [player.p for player in players])
-
-    scores, predictions, finalPrediction, marketPrediction = simulate(players, q)
-    score = calculateScore(marketPrediction, finalPrediction, "brier")
-
-    scoresList.append(scores)
-    predictionsList.append(predictions)
-    finalPredictionList.append(finalPrediction)
-    marketPredictionList.append(marketPrediction)
-    scoreList.append(score)
-
-  json_result_handler.write_results(config, scoresList, predictionsList, finalPredictionList, marketPredictionList, scoreList)
-
-if __name__ == "__main__":
-  # with open("config.json", "r") as config_file:
-  #   config = json.load(config_file)
-  
+def make_parser():
   parser = argparse.ArgumentParser(description="Run the prediction market simulation.")
-  parser.add_argument("--n", type=int, required=True, help="Number of players")
-  parser.add_argument("--player_type", type=str, required=True, choices=["perfect", "relaxed"], help="Type of player to instantiate")
-  parser.add_argument("--noise", type=str, choices=["identity", "gaussian", "uniform", "sinusoidal", "exponential"], default="identity", help="Noise function")
+  parser.add_argument("--n", type=int, help="Number of players (required)")
+  parser.add_argument("--player_type", type=str, choices=PLAYER_TYPES, help="Type of player to instantiate (required)")
+  parser.add_argument("--noise", type=str, choices=NOISE_FUNCTIONS, default="identity", help="Noise function")
   parser.add_argument("--noise_delta", type=float, default=0.01, help="Delta for noise function")
   parser.add_argument("--radius", type=int, help="Radius for RelaxedInformationPlayer")
-
-  args = parser.parse_args()
+  parser.add_argument("--belief", type=str, choices=["uniform", "normal", "discrete"], default="uniform", help="AverageCalculationPlayer: distribution of the p it assumes for the players after it")
+  parser.add_argument("--belief_spread", type=float, default=0.05, help="Radius of the uniform belief or standard deviation of the normal one, around the player's p")
+  parser.add_argument("--belief_points", type=int, default=11, help="Support points of the uniform and normal beliefs")
+  parser.add_argument("--belief_values", type=float, nargs="+", help="Values of the discrete belief")
+  parser.add_argument("--belief_probabilities", type=float, nargs="+", help="Probabilities of the discrete belief values (equal by default)")
+  parser.add_argument("--lookahead", type=int, default=1, help="Later players solved exactly by MeanFieldPlayer; the rest are a mean-field estimate")
+  parser.add_argument("--solver", type=str, choices=SOLVERS, default="memoized", help="Solver for PerfectInformationPlayer; batched solves all q values at once. RelaxedInformationPlayer uses its memoized solver unless this is recursive")
+  parser.add_argument("--delta", type=float, default=config["delta"], help="Step of the final prediction grid")
+  parser.add_argument("--deltaQ", type=float, default=config["deltaQ"], help="Step between the q values of the sweep")
+  parser.add_argument("--coarse_delta", type=float, default=0.1, help="Step of the first grid searched by --solver multires")
+  parser.add_argument("--warm_radius", type=int, default=2, help="Grid steps around the previous q's best response searched first by --solver warm")
+  parser.add_argument("--verify", action="store_true", help="Also solve every q with the exhaustive memoized scan and record the differences (small instances)")
+  parser.add_argument("--prune", action="store_true", help="Branch and bound in the recursive PerfectInformationPlayer search (--solver recursive)")
+  parser.add_argument("--workers", type=int, default=1, help="Number of processes solving q values in parallel")
+  parser.add_argument("--seed", type=int, help="Seed for the noise generators")
+  parser.add_argument("--replications", type=int, help="Number of noisy replications; writes per-q statistics instead of a single run")
+  parser.add_argument("--output", type=str, help="Name of the result files in results/ (defaults to a timestamp)")
+  parser.add_argument("--budget", type=float, help="Seconds after which no new q is started; the results so far are kept and --resume finishes the run")
+  parser.add_argument("--resume", action="store_true", help="Skip the q values already stored in results/<output>.jsonl")
+  parser.add_argument("--store", type=str, help="Also add the run to the columnar result store in this directory (see src/store.py)")
+  parser.add_argument("--instrument", action="store_true", help="Record per-q predict calls, score evaluations and cache hits next to the results")
+  parser.add_argument("--cache", type=str, help="SQLite file of best responses reused across runs (memoized, analytic and recursive solvers)")
+  parser.add_argument("--cache_size", type=int, default=256, help="Size in MB above which the least recently used cache tables are evicted")
+  parser.add_argument("--log_level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="INFO", help="DEBUG also logs every simulation step; with --serve, the level of the whole server")
+  parser.add_argument("--profile", action="store_true", help="Dump a cProfile report of the run (main process only) to results/<output>.prof")
+  parser.add_argument("--serve", action="store_true", help="Keep one process running configs given as lines of these arguments on stdin (see serve)")
+  parser.add_argument("--socket", type=str, help="With --serve, read the configs from connections to this Unix socket instead of stdin")
+  return parser
+
+# Config of a run from its parsed arguments, on top of the defaults
+def make_config(parser, args, defaults=config):
+  config = {**defaults}
+  for name in ["n", "player_type"]:
+    if getattr(args, name) is None:
+      parser.error(f"--{name} is required")
+  # As src.utils.isGridStep, without importing NumPy
+  for name in ["delta", "deltaQ"]:
+    step = getattr(args, name)
+    if not (0 < step <= 1 and math.isclose(round(1 / step) * step, 1)):
+      parser.error(f"--{name} = {step} doesn't divide [0, 1] into whole steps")
 
   config["n"] = args.n
+  config["delta"] = args.delta
+  config["deltaQ"] = args.deltaQ
   config["player_type"] = args.player_type
   # config["rule"] = args.rule
   config["noise_function"] = args.noise
   config["noise_delta"] = args.noise_delta
+  config["solver"] = args.solver
+  config["workers"] = args.workers
+  config["seed"] = args.seed
+  if args.resume:
+    if args.output is None:
+      parser.error("--output is required for --resume")
+    config["resume"] = True
+  if args.output is not None:
+    config["output"] = args.output
+  if args.budget is not None:
+    config["budget"] = args.budget
+  if args.store is not None:
+    config["store"] = args.store
+  if args.replications is not None:
+    config["replications"] = args.replications
+    config["quantiles"] = [0.05, 0.25, 0.5, 0.75, 0.95]
   if args.player_type == "relaxed":
     if args.radius is None:
       parser.error("--radius is required for RelaxedInformationPlayer")
     config["radius"] = args.radius
+  if args.player_type == "average":
+    config["belief"] = args.belief
+    if args.belief == "discrete":
+      if args.belief_values is None:
+        parser.error("--belief_values is required for a discrete belief")
+      if args.belief_probabilities is not None and len(args.belief_probabilities) != len(args.belief_values):
+        parser.error("--belief_probabilities needs one probability per value")
+      config["belief_values"] = args.belief_values
+      if args.belief_probabilities is not None:
+        config["belief_probabilities"] = args.belief_probabilities
+    else:
+      config["belief_spread"] = args.belief_spread
+      config["belief_points"] = args.belief_points
+  if args.player_type in ("meanfield", "average") and args.cache is not None:
+    parser.error(f"--cache is not supported for {args.player_type} players")
+  if args.player_type == "meanfield":
+    config["lookahead"] = args.lookahead
+
+  if args.solver == "multires":
+    config["coarse_delta"] = args.coarse_delta
+  if args.solver == "warm":
+    config["warm_radius"] = args.warm_radius
+  if args.verify:
+    config["verify"] = True
+  if args.prune:
+    config["prune"] = True
+  if args.instrument:
+    config["instrument"] = True
+  if args.cache is not None:
+    config["cache"] = args.cache
+    config["cache_size"] = args.cache_size
+  if args.profile and "output" not in config:
+    config["output"] = str(int(time.time()))
+  return config
+
+# Runs a config in this process and returns its wall time in seconds
+def run(config, profile=False):
+  import runner
 
   start_time = time.time()
-  execute(config)
-  end_time = time.time()
+  if profile:
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.runcall(runner.execute, config)
+    profiler.dump_stats(f"results/{config['output']}.prof")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(25)
+  else:
+    runner.execute(config)
+  return time.time() - start_time
+
+# Numbers of the requests of a server, across its connections
+requests = itertools.count(1)
+
+# Runs one request of a server: a line of main.py arguments, e.g. "--n 3 --player_type perfect"
+# Runs without --output are named after the time, the server and the request, since a server
+# can finish several runs within a second
+def handle_request(parser, line):
+  request = next(requests)
+  try:
+    args = parser.parse_args(shlex.split(line))
+    if args.serve:
+      parser.error("--serve is not allowed in a request")
+    config = make_config(parser, args)
+    if args.output is None:
+      config["output"] = f"{int(time.time())}-{os.getpid()}-{request}"
+  except SystemExit:
+    # argparse has written the reason to stderr
+    return {"request": request, "error": f"invalid arguments: {line.strip()}"}
+
+  try:
+    execution_time = run(config, args.profile)
+  except Exception as error:
+    logger.exception(f"Request {request} failed")
+    return {"request": request, "error": repr(error)}
+  return {"request": request, "output": config["output"], "time": execution_time}
+
+# Answers every non-empty line with one JSON line
+def serve_lines(parser, lines, respond):
+  for line in lines:
+    if line.strip():
+      respond(json.dumps(handle_request(parser, line)) + "\n")
+
+# Persistent mode for schedulers launching many small runs: one process pays for the imports
+# once and keeps its per-process state (best-response caches, expected-score engines) warm.
+# Requests are read from stdin, or from connections to a local Unix socket (one at a time, so
+# runs never compete for the CPU), and answered in order on the same stream:
+#
+#   $ python main.py --serve
+#   --n 3 --player_type perfect --delta 0.1
+#   {"request": 1, "output": "1760000000-4242-1", "time": 0.41}
+def serve(parser, socket_path=None):
+  if socket_path is None:
+    responses = sys.stdout
+    def respond(response):
+      responses.write(response)
+      responses.flush()
+    # Only the responses go to stdout: anything a request prints (--help, the --profile report)
+    # goes to stderr with the logs
+    with contextlib.redirect_stdout(sys.stderr):
+      serve_lines(parser, sys.stdin, respond)
+    return
+
+  import socketserver
+
+  class Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+      lines = (line.decode() for line in self.rfile)
+      serve_lines(parser, lines, lambda response: self.wfile.write(response.encode()))
+
+  if os.path.exists(socket_path):
+    os.remove(socket_path)
+  server = socketserver.UnixStreamServer(socket_path, Handler)
+  logger.info(f"Serving on {socket_path}")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(socket_path)
+
+if __name__ == "__main__":
+  # with open("config.json", "r") as config_file:
+  #   config = json.load(config_file)
+
+  parser = make_parser()
+  args = parser.parse_args()
+  # When serving stdin, stdout carries the responses
+  logging.basicConfig(level=args.log_level, format="%(message)s", stream=sys.stderr if args.serve and args.socket is None else sys.stdout)
 
-  execution_time = end_time - start_time
-  print(f"Execution time: {execution_time:.2f} seconds")
\ No newline at end of file
+  if args.serve:
+    serve(parser, args.socket)
+  else:
+    run(make_config(parser, args), args.profile)
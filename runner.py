@@ -0,0 +1,522 @@
+import importlib
+import itertools
+import logging
+import math
+import numpy as np
+import os
+import time
+
+from src.rules import calculateScore
+from src.simulation import simulate
+from src.player import AverageCalculationPlayer, MeanFieldPlayer, PerfectInformationPlayer, RelaxedInformationPlayer
+from src.utils import equalRules, equalWeights, predictionGrid
+from src.results import JSONResultHandler, JSONLinesResultHandler
+from src.noise import get_noisy_q, get_noisy_q_batch
+from src.instrumentation import stats, mergeRecords
+
+logger = logging.getLogger(__name__)
+
+# Engines for PerfectInformationPlayer as (module, name); "recursive" uses the players' own predict
+# Engines are imported by load when a run selects them, and the modules of the other optional
+# features (beliefs, ticks, cache, result store, worker pools) where they are used, so a run
+# only pays for the imports its config needs
+SOLVERS = {
+  "memoized": ("src.solver", "MemoizedSolver"),
+  "analytic": ("src.solver", "AnalyticSolver"),
+  "ticks": ("src.ticks", "TickSolver"),
+  "multires": ("src.solver", "MultiResolutionSolver"),
+  "warm": ("src.solver", "WarmStartSolver"),
+  "iterative": ("src.solver", "IterativeSolver"),
+  "recursive": None
+}
+
+# Engines that solve every q of the sweep at once instead of one simulate() per q
+BATCH_SOLVERS = {
+  "batched": ("src.batch", "solveBatch")
+}
+
+# Class or function of a (module, name) pair, importing its module on first use
+def load(module, name):
+  return getattr(importlib.import_module(module), name)
+
+# One connection per process to the persistent best-response cache, None when it is disabled
+caches = {}
+def get_cache(config):
+  if not config.get("cache"):
+    return None
+  if config["cache"] not in caches:
+    from src.cache import BestResponseCache
+    caches[config["cache"]] = BestResponseCache(config["cache"], config["cache_size"] * 2 ** 20)
+  return caches[config["cache"]]
+
+# One ExpectedScoreEngine per process and market, so every q reuses the best-response tables of
+# the p values hypothesised so far
+engines = {}
+def get_engine(weights, rules, possiblePredictions):
+  key = (tuple(weights), tuple(rules), len(possiblePredictions))
+  if key not in engines:
+    from src.beliefs import ExpectedScoreEngine
+    engines[key] = ExpectedScoreEngine(weights, rules, possiblePredictions)
+  return engines[key]
+
+# Belief of an AverageCalculationPlayer with belief p about the p of the players after it
+def make_belief(config, p):
+  from src.beliefs import BeliefDistribution
+  if config["belief"] == "uniform":
+    return BeliefDistribution.uniform(p, config["belief_spread"], config["belief_points"])
+  if config["belief"] == "normal":
+    return BeliefDistribution.truncatedNormal(p, config["belief_spread"], config["belief_points"])
+  return BeliefDistribution.discrete(config["belief_values"], config.get("belief_probabilities"))
+
+# TickGrid of a run whose results are written in ticks, None for the float engines
+def get_tick_grid(config, weights):
+  if config["player_type"] == "perfect" and config.get("solver") == "ticks":
+    from src.ticks import TickGrid
+    return TickGrid(config["delta"], weights)
+  return None
+
+# Last WarmStartSolver of this process: q values are solved in order, so it holds the
+# best responses of the previous q. Cleared when a run starts (see solve_records), so a process
+# running several configs never seeds one from another
+warm_starts = {}
+
+# solver is the name of the engine, read by solve_beliefs with its default
+def make_solver(config, solver, players, cache):
+  engine = load(*SOLVERS[solver])
+  if solver == "multires":
+    return engine(players, coarseDelta=config.get("coarse_delta", 0.1))
+  if solver == "warm":
+    warm_starts["previous"] = engine(players, cache, warm_starts.get("previous"), config.get("warm_radius", 2))
+    return warm_starts["previous"]
+  return engine(players, cache)
+
+# Compares a run against the exhaustive scan of MemoizedSolver on the same beliefs
+def verify(players, q, scores, predictions, marketPrediction):
+  from src.solver import MemoizedSolver
+  exactScores, exactPredictions, _, exactMarketPrediction = simulate(players, q, MemoizedSolver(players))
+  return {
+    "matches": list(predictions) == list(exactPredictions),
+    "predictionError": max(abs(a - b) for a, b in zip(predictions, exactPredictions)),
+    "marketPredictionError": abs(marketPrediction - exactMarketPrediction),
+    "scoreLoss": [a - b for a, b in zip(exactScores, scores)]
+  }
+
+# Returns the results and a dict of optional details for the record: instrumentation, verification
+def solve_beliefs(config, q, beliefs, weights, rules, possiblePredictions):
+  n = config["n"]
+  player_type = config["player_type"]
+  solver = config.get("solver", "memoized")
+  players = []
+
+  if config.get("instrument"):
+    stats.enable()
+
+  if player_type == "relaxed":
+    players = [RelaxedInformationPlayer(i, weights[i], rules[i], beliefs[i], possiblePredictions, config["radius"]) for i in range(n)]
+  elif player_type == "perfect":
+    players = [PerfectInformationPlayer(i, weights[i], rules[i], beliefs[i], possiblePredictions, config.get("prune", False)) for i in range(n)]
+  elif player_type == "average":
+    expectedScores = get_engine(weights, rules, possiblePredictions)
+    players = [AverageCalculationPlayer(i, weights[i], rules[i], beliefs[i], possiblePredictions, make_belief(config, beliefs[i]), expectedScores) for i in range(n)]
+  elif player_type == "meanfield":
+    players = [MeanFieldPlayer(i, weights[i], rules[i], beliefs[i], possiblePredictions, config["lookahead"]) for i in range(n)]
+
+  logger.debug("Simulation step %s", [player.p for player in players])
+
+  # The solver engines only model PerfectInformationPlayer
+  grid = get_tick_grid(config, weights)
+  if grid is not None:
+    # Predictions and market sums stay in ticks until JSONResultHandler writes them
+    from src.ticks import TickSolver
+    scores, predictions, finalPrediction, marketPrediction = TickSolver(players, grid).simulate(q)
+    score = calculateScore(grid.toMarketPrediction(marketPrediction), grid.toFinalPrediction(finalPrediction), "brier")
+    details = {}
+    if config.get("verify"):
+      details["verification"] = verify(players, q, scores, [grid.toPrediction(tick) for tick in predictions], grid.toMarketPrediction(marketPrediction))
+    return (scores, predictions, finalPrediction, marketPrediction, score), details
+
+  cache = get_cache(config)
+  engine = None
+  if player_type == "perfect" and SOLVERS.get(solver) is not None:
+    engine = make_solver(config, solver, players, cache)
+    scores, predictions, finalPrediction, marketPrediction = simulate(players, q, engine)
+  elif player_type == "relaxed" and solver != "recursive":
+    from src.solver import RelaxedSolver
+    scores, predictions, finalPrediction, marketPrediction = simulate(players, q, RelaxedSolver(players, cache))
+  else:
+    if cache is not None:
+      for player in players:
+        player.useCache(cache, players)
+    scores, predictions, finalPrediction, marketPrediction = simulate(players, q)
+  score = calculateScore(marketPrediction, finalPrediction, "brier")
+
+  if cache is not None:
+    cache.flush(config["output"])
+
+  details = {}
+  if stats.enabled:
+    details["instrumentation"] = mergeRecords(stats.collect())
+  if is_warm_started(config):
+    details["warmStart"] = engine.getReport()
+  if player_type == "perfect" and solver == "iterative":
+    details["memory"] = engine.getMemoryReport()
+  if config.get("verify") and player_type in ("perfect", "meanfield"):
+    details["verification"] = verify(players, q, scores, predictions, marketPrediction)
+  return (scores, predictions, finalPrediction, marketPrediction, score), details
+
+# Each q draws its beliefs from its own generator, so noisy runs are reproducible
+# regardless of how many workers share the sweep
+def draw_beliefs(config, q, seedSequence):
+  rng = np.random.default_rng(seedSequence)
+
+  # if p is defined here, all players have same beliefs
+  # p = get_noisy_q(q, noiseFn, 0.025)
+  return [get_noisy_q(q, config["noise_function"], config["noise_delta"], rng) for _ in range(config["n"])]
+
+def solve_q(config, q, weights, rules, possiblePredictions, seedSequence):
+  start_time = time.time()
+  beliefs = draw_beliefs(config, q, seedSequence)
+
+  result, details = solve_beliefs(config, q, beliefs, weights, rules, possiblePredictions)
+  return result, details, os.getpid(), time.time() - start_time
+
+# Solves one belief profile per column with a batch engine and yields the results in the
+# same format as solve_beliefs, one per column
+def solve_batch(config, qValues, beliefs, weights, rules, possiblePredictions):
+  solver = load(*BATCH_SOLVERS[config["solver"]])
+  scores, predictions, finalPrediction, marketPrediction = solver(weights, rules, np.array(beliefs).T, qValues, possiblePredictions)
+
+  for i in range(len(qValues)):
+    result = (scores[i].tolist(), predictions[i].tolist(), float(finalPrediction[i]), float(marketPrediction[i]))
+    score = calculateScore(result[3], result[2], "brier")
+    yield (*result, score), {}
+
+def is_batched(config):
+  return config["player_type"] == "perfect" and config.get("solver") in BATCH_SOLVERS
+
+def is_warm_started(config):
+  return config["player_type"] == "perfect" and config.get("solver") == "warm"
+
+# Candidate evaluations of the warm-started searches against full scans of the same searches
+def summarize_warm_starts(reports):
+  total = {key: sum(report[key] for report in reports) for key in ["searches", "fallbacks", "evaluated", "gridEvaluations"]}
+  total["saved"] = 1 - total["evaluated"] / total["gridEvaluations"] if total["gridEvaluations"] else None
+  return total
+
+# Yields the results in job order as soon as each one is available
+# With contiguous=True each worker gets one consecutive block of jobs instead of one job at a
+# time, for solvers that reuse the previous job of their process (warm starts)
+# stop is polled between jobs; once it returns True no more results are yielded and the jobs
+# not started yet are cancelled
+def run_jobs(fn, jobs, workers, contiguous=False, stop=None):
+  if workers > 1:
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = math.ceil(len(jobs) / workers) if contiguous else 1
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+      for result in executor.map(fn, *zip(*jobs), chunksize=chunksize):
+        yield result
+        if stop is not None and stop():
+          return
+    finally:
+      executor.shutdown(cancel_futures=True)
+  else:
+    for job in jobs:
+      if stop is not None and stop():
+        return
+      yield fn(*job)
+
+# Stop condition of a run: wall-clock budget in seconds since the call and/or a cancel hook
+def make_stop(budget=None, cancel=None):
+  start_time = time.time()
+  def stop():
+    return (budget is not None and time.time() - start_time >= budget) or (cancel is not None and cancel())
+  return stop
+
+def summarize(values, quantiles):
+  return {
+    "mean": values.mean(axis=0).tolist(),
+    "variance": values.var(axis=0).tolist(),
+    "quantiles": {str(quantile): np.quantile(values, quantile, axis=0).tolist() for quantile in quantiles}
+  }
+
+# Share of runs that matched the exhaustive scan and the largest errors of the others
+# Accepts verify() results and summaries of them
+def summarize_verification(verifications):
+  return {
+    "matchRate": float(np.mean([verification.get("matchRate", verification.get("matches")) for verification in verifications])),
+    "predictionError": max(verification["predictionError"] for verification in verifications),
+    "marketPredictionError": max(verification["marketPredictionError"] for verification in verifications),
+    "scoreLoss": np.max([verification["scoreLoss"] for verification in verifications], axis=0).tolist()
+  }
+
+# Largest memory figures of IterativeSolver over the solved q values
+def summarize_memory(reports):
+  return {key: max(report[key] for report in reports) for key in ["peakDepth", "tableEntries", "tableBytes", "stackBytes"]}
+
+# Monte Carlo mode: R noisy replications of the whole q sweep
+# All beliefs are drawn in one call and every distinct belief profile is solved once,
+# since beliefs are rounded to 2 decimals and replications repeat them constantly
+# Yields the statistics of each q as soon as all its profiles are solved
+def replication_records(config, weights, rules, qValues, possiblePredictions, completed=(), stop=None):
+  n = config["n"]
+  replications = config["replications"]
+  rng = np.random.default_rng(config["seed"])
+  grid = get_tick_grid(config, weights)
+
+  # Beliefs for every q are drawn even when resuming, so the pending ones stay reproducible
+  shape = (replications, len(qValues), n)
+  qArray = np.array(qValues).reshape(1, -1, 1)
+  beliefs = get_noisy_q_batch(qArray, config["noise_function"], config["noise_delta"], shape, rng)
+
+  jobs = []
+  groups = []
+  for j, q in enumerate(qValues):
+    if q in completed:
+      continue
+    uniqueBeliefs, inverse = np.unique(beliefs[:, j, :], axis=0, return_inverse=True)
+    groups.append((j, inverse.reshape(-1), len(uniqueBeliefs)))
+    jobs.extend((config, q, row.tolist(), weights, rules, possiblePredictions) for row in uniqueBeliefs)
+
+  logger.info(f"Solving {len(jobs)} distinct belief profiles for {replications * len(groups)} replications")
+  if is_batched(config):
+    solved = solve_batch(config, [job[1] for job in jobs], [job[2] for job in jobs], weights, rules, possiblePredictions)
+  else:
+    solved = run_jobs(solve_beliefs, jobs, config.get("workers", 1), is_warm_started(config), stop)
+
+  for j, inverse, count in groups:
+    group = list(itertools.islice(solved, count))
+    if len(group) < count:
+      # Stopped: a q is only recorded once every one of its profiles is solved
+      return
+    results, details = zip(*group)
+    if grid is not None:
+      results = [(scores, [grid.toPrediction(tick) for tick in predictions], grid.toFinalPrediction(final), grid.toMarketPrediction(market), score) for scores, predictions, final, market, score in results]
+    uniqueScores, uniquePredictions, uniqueFinal, uniqueMarket, uniqueScore = (np.array(values) for values in zip(*results))
+
+    record = {"q": qValues[j], "beliefs": {"mean": beliefs[:, j].mean(axis=0).tolist(), "variance": beliefs[:, j].var(axis=0).tolist()}}
+    record["scores"] = summarize(uniqueScores[inverse], config["quantiles"])
+    record["predictions"] = summarize(uniquePredictions[inverse], config["quantiles"])
+    record["finalPrediction"] = summarize(uniqueFinal[inverse], config["quantiles"])
+    record["marketPrediction"] = summarize(uniqueMarket[inverse], config["quantiles"])
+    record["score"] = summarize(uniqueScore[inverse], config["quantiles"])
+    if config.get("instrument"):
+      record["instrumentation"] = mergeRecords([detail.get("instrumentation") for detail in details if detail.get("instrumentation")])
+    if is_warm_started(config):
+      record["warmStart"] = summarize_warm_starts([detail["warmStart"] for detail in details])
+    if details[0].get("memory"):
+      record["memory"] = summarize_memory([detail["memory"] for detail in details])
+    if config.get("verify") and config["player_type"] in ("perfect", "meanfield"):
+      record["verification"] = summarize_verification([details[k]["verification"] for k in inverse])
+    yield record
+
+# Weights, rules, q values, prediction grid and one seed sequence per q of a run
+# Draws the seed of the run if it has none
+def get_market(config):
+  if config.get("seed") is None:
+    config["seed"] = np.random.SeedSequence().entropy
+
+  # Should we add a config for weights, rules?
+  weights = equalWeights(config["n"])
+  rules = equalRules(config["n"], "brier")
+
+  qValues = predictionGrid(config["deltaQ"])
+  possiblePredictions = predictionGrid(config["delta"])
+  seedSequences = np.random.SeedSequence(config["seed"]).spawn(len(qValues))
+  return weights, rules, qValues, possiblePredictions, seedSequences
+
+# Records of the q values not in completed, in q order, as soon as each one is solved
+# Records of the ticks solver stay in ticks (see get_tick_grid). If workerTimes is a dict, the
+# number of q values and seconds spent by each worker process are added to it
+def solve_records(config, completed=(), stop=None, workerTimes=None):
+  warm_starts.clear()
+  weights, rules, qValues, possiblePredictions, seedSequences = get_market(config)
+  if config.get("replications"):
+    yield from replication_records(config, weights, rules, qValues, possiblePredictions, completed, stop)
+    return
+
+  pending = [(i, q) for i, q in enumerate(qValues) if q not in completed]
+  jobs = [(config, q, weights, rules, possiblePredictions, seedSequences[i]) for i, q in pending]
+
+  if is_batched(config):
+    # One call for the whole sweep, timed as a single job of the main process
+    start_time = time.time()
+    beliefs = [draw_beliefs(config, q, seedSequences[i]) for i, q in pending]
+    results = list(solve_batch(config, [q for _, q in pending], beliefs, weights, rules, possiblePredictions))
+    elapsed = (time.time() - start_time) / max(len(results), 1)
+    solved = ((result, details, os.getpid(), elapsed) for result, details in results)
+  else:
+    solved = run_jobs(solve_q, jobs, config.get("workers", 1), is_warm_started(config), stop)
+
+  for (i, q), ((scores, predictions, finalPrediction, marketPrediction, score), details, pid, elapsed) in zip(pending, solved):
+    record = {
+      "q": q,
+      "scores": scores,
+      "predictions": predictions,
+      "finalPrediction": finalPrediction,
+      "marketPrediction": marketPrediction,
+      "score": score
+    }
+    record.update(details)
+
+    if workerTimes is not None:
+      count, total = workerTimes.get(pid, (0, 0))
+      workerTimes[pid] = (count + 1, total + elapsed)
+    yield record
+
+# Streaming API for notebooks and services: yields one record per q (with replications, the
+# statistics of one q) as soon as it is solved, in q order, with predictions as floats
+# budget is a wall-clock limit in seconds after which no new q is started, and cancel a
+# callable polled between q values that stops the run once it returns True. With workers the
+# q values not started yet are cancelled; a batched sweep is a single solve and runs to the end
+#
+#   for record in runner.simulate_iter({**main.config, "player_type": "perfect", ...}, budget=60):
+#     plot(record["q"], record["marketPrediction"])
+def simulate_iter(config, budget=None, cancel=None):
+  grid = None if config.get("replications") else get_tick_grid(config, equalWeights(config["n"]))
+  try:
+    for record in solve_records(config, stop=make_stop(budget, cancel)):
+      yield grid.toFloats(record) if grid is not None else record
+  finally:
+    end_instrumentation(config)
+
+# Async variant of simulate_iter for event loops (dashboards, servers): every record is solved
+# in executor (the default thread pool when None; it must run threads, since the generator
+# moves between them) and awaited, so other tasks keep running. Closing the iterator or
+# cancelling the consuming task waits for the q being solved, then closes the run
+async def simulate_aiter(config, budget=None, cancel=None, executor=None):
+  import asyncio
+  import threading
+  loop = asyncio.get_running_loop()
+  cancelled = threading.Event()
+  # Set while no record is being solved; the asyncio future of a step is cancelled with the
+  # task, but the step itself keeps running in its thread
+  idle = threading.Event()
+  idle.set()
+  records = simulate_iter(config, budget, lambda: cancelled.is_set() or (cancel is not None and cancel()))
+
+  def step():
+    try:
+      return next(records, None)
+    finally:
+      idle.set()
+
+  try:
+    while True:
+      idle.clear()
+      record = await loop.run_in_executor(executor, step)
+      if record is None:
+        break
+      yield record
+  finally:
+    cancelled.set()
+    if not idle.is_set():
+      await loop.run_in_executor(None, idle.wait)
+    records.close()
+
+# solve_beliefs turns the instrumentation on for the process of an instrumented run; later runs
+# of the same process (sweep workers, main.py --serve) must not inherit it
+def end_instrumentation(config):
+  if config.get("instrument"):
+    stats.disable()
+
+# Runs a config and writes its results; cancel is polled between q values like the budget
+# (see simulate_iter). A cancelled run gives up its files: e.g. a sweep worker whose job was
+# handed to another worker, which is already resuming and appending to them. So its buffered
+# records are dropped and nothing is consolidated
+def execute(config, cancel=None):
+  ts = config.setdefault("output", str(int(time.time())))
+
+  sink = JSONLinesResultHandler(ts)
+  completed = set()
+  if config.get("resume") and sink.exists():
+    stored_config, records = sink.read_records()
+    ignored = ["workers", "resume", "seed", "cache", "cache_size", "budget", "store"]
+    # Keys of either config count, so a run stored with an option (instrument, verify, prune, ...)
+    # isn't resumed without it
+    if stored_config is None or any(stored_config.get(key) != config.get(key) for key in set(stored_config) | set(config) if key not in ignored):
+      raise ValueError(f"{sink.filename} was written with a different config: {stored_config}")
+    # Keep the seed of the original run so the pending q values draw the same beliefs
+    config["seed"] = stored_config["seed"]
+    completed = {record["q"] for record in records}
+
+  n = config["n"]
+  delta = config["delta"]
+  deltaQ = config["deltaQ"]
+  player_type = config["player_type"]
+  noise_function = config["noise_function"]
+  noise_delta = config["noise_delta"]
+  solver = config.get("solver", "memoized")
+  workers = config.get("workers", 1)
+
+  weights, rules, qValues, _, _ = get_market(config)
+
+  logger.info(f"Executing simulation...")
+  logger.info(f"n = {n}; players = {player_type}; weights = {weights}; rules = {rules}; delta = {delta}; deltaQ = {deltaQ}")
+  logger.info(f"noise_function = {noise_function}; noise_delta = {noise_delta}; solver = {solver}; workers = {workers}; seed = {config['seed']}")
+  if completed:
+    logger.info(f"Resuming {sink.filename}: skipping {len(completed)} solved q values")
+
+  sink.open(config, resume=config.get("resume", False))
+
+  stop = make_stop(config.get("budget"), cancel)
+  workerTimes = {}
+  cancelled = False
+  try:
+    for record in solve_records(config, completed, stop, workerTimes):
+      # Checked again before writing, since the q just solved may have outlasted the cancel
+      if cancel is not None and cancel():
+        break
+      sink.write_record(record)
+    cancelled = cancel is not None and cancel()
+  finally:
+    if cancelled:
+      sink.discard()
+    else:
+      sink.close()
+    end_instrumentation(config)
+
+  if cancelled:
+    logger.info(f"Cancelled; left {sink.filename} to the run that resumes it")
+    return
+
+  for pid, (count, total) in workerTimes.items():
+    logger.info(f"Worker {pid}: {count} q values in {total:.2f} seconds")
+
+  # Consolidate the streamed records into the usual JSON result
+  _, records = sink.read_records()
+  if len(records) < len(qValues):
+    logger.info(f"Stopped after the time budget of {config['budget']} seconds with {len(records)} of {len(qValues)} q values; finish the run with --resume --output {ts}")
+  records.sort(key=lambda record: qValues.index(record["q"]))
+  grid = get_tick_grid(config, weights)
+  JSONResultHandler(ts).write_records(config, records, grid)
+  if config.get("store"):
+    from src.store import ResultStore
+    store = ResultStore(config["store"])
+    store.write(ts, config, [grid.toFloats(record) for record in records] if grid is not None and not config.get("replications") else records)
+    store.close()
+
+  if config.get("instrument"):
+    summary = stats.summary([record["instrumentation"] for record in records if record.get("instrumentation")])
+    logger.info(f"Instrumentation: {summary}")
+
+  if config.get("verify"):
+    verifications = [record["verification"] for record in records if record.get("verification")]
+    if verifications:
+      logger.info(f"Verification against the exhaustive scan: {summarize_verification(verifications)}")
+
+  if is_warm_started(config):
+    warmStart = summarize_warm_starts([record["warmStart"] for record in records if record.get("warmStart")])
+    if warmStart["saved"] is not None:
+      logger.info(f"Warm start: {warmStart['evaluated']} of {warmStart['gridEvaluations']} candidate evaluations ({warmStart['saved']:.1%} saved); {warmStart['fallbacks']} of {warmStart['searches']} searches widened past the window")
+
+  memory = [record["memory"] for record in records if record.get("memory")]
+  if memory:
+    peak = summarize_memory(memory)
+    logger.info(f"Peak memory per q: {peak['tableBytes'] / 2 ** 20:.1f} MB of best-response tables ({peak['tableEntries']} entries), {peak['stackBytes'] / 2 ** 10:.1f} KB of stack for depth {peak['peakDepth']}")
+
+  cache = get_cache(config)
+  if cache is not None:
+    usage = cache.getUsage(ts)
+    hitRate = "n/a" if usage["hitRate"] is None else f"{usage['hitRate']:.1%}"
+    logger.info(f"Best-response cache {config['cache']}: {usage['hits']} hits, {usage['misses']} misses ({hitRate}); {usage['loaded']} entries loaded, {usage['written']} written, {usage['evicted']} tables evicted")
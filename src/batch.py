@@ -0,0 +1,127 @@
+import numpy as np
+
+from .rules import calculateScoreVector, fVector
+
+# Backward induction for many belief profiles at once
+# Every column of `beliefs` (shape (n, columns)) is an independent market, e.g. one column per q
+# value in identity-noise runs. Instead of recursing, the engine enumerates every partial sum a
+# player can be asked to respond to and solves each player for all of them and all columns in a
+# few array operations, from the last player to the first. States are the exact floats the
+# recursive path computes, so predictions are identical to PerfectInformationPlayer.predict
+
+# Partial sums player j can face: player x < j at any of its own states, plus its weighted prediction
+def getReachableStates(weights, possiblePredictions):
+  grid = np.asarray(possiblePredictions, dtype=float)
+  states = [np.zeros(1)]
+
+  for j in range(1, len(weights)):
+    partialSums = [(states[x][:, None] + weights[x] * grid[None, :]).ravel() for x in range(j)]
+    states.append(np.unique(np.concatenate(partialSums)))
+
+  return states
+
+# Best response of every player to every reachable state, one column per belief profile
+def getBestResponses(weights, rules, beliefs, possiblePredictions, states):
+  n = len(weights)
+  grid = np.asarray(possiblePredictions, dtype=float)
+  bestResponses = [None] * n
+
+  for j in reversed(range(n)):
+    p = beliefs[j][None, None, :]
+    partialSums = states[j][:, None] + weights[j] * grid[None, :]
+    finalPredictions = np.repeat(partialSums[:, :, None], beliefs.shape[1], axis=2)
+
+    # Later players all respond to the same partial sum
+    for k in range(j + 1, n):
+      stateIndices = np.searchsorted(states[k], partialSums)
+      finalPredictions = finalPredictions + bestResponses[k][stateIndices] * weights[k]
+
+    scores = calculateScoreVector(grid[None, :, None], fVector(finalPredictions, p), rules[j])
+    maxScores = calculateScoreVector(0.0, fVector(states[j][:, None], beliefs[j][None, :]), rules[j])
+
+    # First best prediction, kept only if it beats predicting 0 without looking ahead
+    best = np.argmax(scores, axis=1)
+    bestScores = np.take_along_axis(scores, best[:, None, :], axis=1)[:, 0, :]
+    bestResponses[j] = np.where(bestScores > maxScores, grid[best], 0.0)
+
+  return bestResponses
+
+# Solves every column and returns arrays shaped like the per-q lists built by execute():
+# scores and predictions (columns, n), finalPrediction and marketPrediction (columns,)
+# maxColumns bounds the size of the intermediate (states, grid, columns) arrays
+def solveBatch(weights, rules, beliefs, qValues, possiblePredictions, maxColumns=64):
+  beliefs = np.asarray(beliefs, dtype=float)
+  qValues = np.asarray(qValues, dtype=float)
+  n, columns = beliefs.shape
+  states = getReachableStates(weights, possiblePredictions)
+
+  predictions = np.empty((columns, n))
+  for start in range(0, columns, maxColumns):
+    end = min(start + maxColumns, columns)
+    bestResponses = getBestResponses(weights, rules, beliefs[:, start:end], possiblePredictions, states)
+
+    # Replay the market: each player responds to the predictions actually made before it
+    currentPredictions = np.zeros(end - start)
+    for j in range(n):
+      stateIndices = np.searchsorted(states[j], currentPredictions)
+      predictions[start:end, j] = bestResponses[j][stateIndices, np.arange(end - start)]
+      currentPredictions = currentPredictions + weights[j] * predictions[start:end, j]
+
+  marketPrediction = getMarketPredictions(weights, predictions)
+  finalPrediction = fVector(marketPrediction, qValues)
+  scores = np.stack([calculateScoreVector(predictions[:, i], finalPrediction, rules[i]) for i in range(n)], axis=1)
+
+  return scores, predictions, finalPrediction, marketPrediction
+
+# Weighted market prediction of each row, summed in player order like simulate()
+def getMarketPredictions(weights, predictions):
+  marketPrediction = np.zeros(predictions.shape[0])
+  for j in range(predictions.shape[1]):
+    marketPrediction = marketPrediction + weights[j] * predictions[:, j]
+  return marketPrediction
+
+# Regret of every player in every row of a solved sweep: how much more it would score by
+# predicting anything else on the grid while the players after it best-respond to that
+# (subgame perfection), scored against its own belief. beliefs has one column per row like
+# solveBatch and predictions shape (rows, n); a row is an equilibrium when all its regrets are 0
+# With baseline=True predicting 0 is also worth the score of 0 without looking ahead, the option
+# every player takes when no prediction beats it; baseline=False measures pure payoff regret,
+# which that rule alone can make positive
+def getRegrets(weights, rules, beliefs, predictions, possiblePredictions, maxColumns=64, baseline=True):
+  beliefs = np.asarray(beliefs, dtype=float)
+  predictions = np.asarray(predictions, dtype=float)
+  grid = np.asarray(possiblePredictions, dtype=float)
+  n, columns = beliefs.shape
+  states = getReachableStates(weights, possiblePredictions)
+
+  chosen = np.searchsorted(grid, predictions)
+  if np.any(chosen >= len(grid)) or np.any(grid[np.minimum(chosen, len(grid) - 1)] != predictions):
+    raise ValueError("predictions must be values of the prediction grid")
+
+  regrets = np.empty((columns, n))
+  for start in range(0, columns, maxColumns):
+    end = min(start + maxColumns, columns)
+    rows = np.arange(end - start)[:, None]
+    bestResponses = getBestResponses(weights, rules, beliefs[:, start:end], possiblePredictions, states)
+
+    # Walk the market as played; at each player try every deviation
+    currentPredictions = np.zeros(end - start)
+    for i in range(n):
+      partialSums = currentPredictions[:, None] + weights[i] * grid[None, :]
+      finalPredictions = partialSums
+      for k in range(i + 1, n):
+        stateIndices = np.searchsorted(states[k], partialSums)
+        finalPredictions = finalPredictions + bestResponses[k][stateIndices, rows] * weights[k]
+
+      scores = calculateScoreVector(grid[None, :], fVector(finalPredictions, beliefs[i, start:end, None]), rules[i])
+      bestScores = scores.max(axis=1)
+      chosenScores = scores[rows[:, 0], chosen[start:end, i]]
+      if baseline:
+        maxScores = calculateScoreVector(0.0, fVector(currentPredictions, beliefs[i, start:end]), rules[i])
+        bestScores = np.maximum(bestScores, maxScores)
+        chosenScores = np.where(predictions[start:end, i] == 0, np.maximum(chosenScores, maxScores), chosenScores)
+      # -inf - -inf under the log rule is no regret either
+      regrets[start:end, i] = np.where(bestScores == chosenScores, 0.0, bestScores - chosenScores)
+      currentPredictions = currentPredictions + weights[i] * predictions[start:end, i]
+
+  return regrets
@@ -0,0 +1,88 @@
+import numpy as np
+
+from .batch import getBestResponses, getReachableStates
+from .rules import calculateScoreVector, fVector
+
+# Distribution over the p a player assumes for the players after it
+# Support points outside [0, 1] are dropped (so uniform and normal are truncated to the
+# probability range), duplicates are merged and the probabilities renormalized. Points are
+# rounded to 4 decimals so players with nearby beliefs hypothesise the same p values and share
+# their best-response tables in ExpectedScoreEngine
+class BeliefDistribution:
+  def __init__(self, support, probabilities):
+    support = np.round(np.asarray(support, dtype=float), 4)
+    probabilities = np.broadcast_to(np.asarray(probabilities, dtype=float), support.shape)
+
+    keep = (probabilities > 0) & (support >= 0) & (support <= 1)
+    if not keep.any():
+      raise ValueError(f"belief has no probability mass in [0, 1]: {support.tolist()}")
+
+    values, inverse = np.unique(support[keep], return_inverse=True)
+    probabilities = np.bincount(inverse, weights=probabilities[keep])
+    self.support = values.tolist()
+    self.probabilities = probabilities / probabilities.sum()
+
+  # `points` equally likely values within radius of center
+  @classmethod
+  def uniform(cls, center, radius, points=11):
+    return cls(np.linspace(center - radius, center + radius, points), 1)
+
+  # Normal density with standard deviation sigma, sampled at `points` values within width
+  # standard deviations of center
+  @classmethod
+  def truncatedNormal(cls, center, sigma, points=11, width=3):
+    if sigma == 0:
+      return cls([center], [1])
+    support = np.linspace(center - width * sigma, center + width * sigma, points)
+    return cls(support, np.exp(-0.5 * ((support - center) / sigma) ** 2))
+
+  # User-supplied values, equally likely unless probabilities are given
+  @classmethod
+  def discrete(cls, values, probabilities=None):
+    return cls(values, 1 if probabilities is None else probabilities)
+
+  def __len__(self):
+    return len(self.support)
+
+# Expected scores of AverageCalculationPlayer
+# Under each hypothesised p every later player is a PerfectInformationPlayer with that p, so its
+# best response to every reachable partial sum comes from the backward induction of
+# src/batch.py, solved for many hypotheses at once (one column each) and kept per hypothesis:
+# the tables don't depend on q or on who asks, so every player and every q of a run reuse them.
+# A player's expected scores are then a (grid, support) array of scores times the probabilities,
+# so their cost grows linearly with the size of the support instead of multiplying a recursion
+class ExpectedScoreEngine:
+  def __init__(self, weights, rules, possiblePredictions, maxColumns=64):
+    self.weights = weights
+    self.rules = rules
+    self.possiblePredictions = possiblePredictions
+    self.grid = np.asarray(possiblePredictions, dtype=float)
+    self.maxColumns = maxColumns
+    self.states = getReachableStates(weights, possiblePredictions)
+    self.tables = {}
+
+  # Solves the hypotheses without tables, maxColumns at a time
+  def solve(self, hypotheses):
+    missing = [p for p in dict.fromkeys(hypotheses) if p not in self.tables]
+    for start in range(0, len(missing), self.maxColumns):
+      chunk = missing[start:start + self.maxColumns]
+      beliefs = np.tile(np.array(chunk), (len(self.weights), 1))
+      bestResponses = getBestResponses(self.weights, self.rules, beliefs, self.possiblePredictions, self.states)
+      for column, p in enumerate(chunk):
+        self.tables[p] = [table[:, column] for table in bestResponses]
+
+  # Expected score of each prediction of the player's grid, given the partial sum it faces
+  def getExpectedScores(self, player, currentPrediction):
+    belief = player.belief
+    self.solve(belief.support)
+
+    # Later players all respond to the same partial sum, under every hypothesis
+    partialSums = currentPrediction + (player.weight * self.grid)
+    finalPredictions = np.repeat(partialSums[:, None], len(belief), axis=1)
+    for k in range(player.index + 1, len(self.weights)):
+      stateIndices = np.searchsorted(self.states[k], partialSums)
+      responses = np.stack([self.tables[p][k][stateIndices] for p in belief.support], axis=1)
+      finalPredictions = finalPredictions + responses * self.weights[k]
+
+    scores = calculateScoreVector(self.grid[:, None], fVector(finalPredictions, player.p), player.rule)
+    return scores @ belief.probabilities
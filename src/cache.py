@@ -0,0 +1,124 @@
+import hashlib
+import json
+import sqlite3
+import time
+
+from . import rules
+
+# Persistent best-response tables shared by runs and processes
+# A player's best response to a partial sum depends on the player and on every player after
+# it (weight, belief, rule and, for RelaxedInformationPlayer, radius), on the prediction grid
+# and on c. Each such context gets one table {partial sum: best prediction}, stored as a row of
+# a SQLite database. Tables are loaded whole when a solver starts, filled in memory and merged
+# back on flush, so concurrent writers only ever add entries. Rows are evicted least recently
+# used first once the database holds more than maxBytes of tables
+class BestResponseCache:
+  def __init__(self, path, maxBytes=256 * 2 ** 20):
+    self.path = path
+    self.maxBytes = maxBytes
+    self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS bestResponses (key TEXT PRIMARY KEY, responses TEXT, size INTEGER, lastUsed REAL)")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS usage (run TEXT PRIMARY KEY, hits INTEGER, misses INTEGER, loaded INTEGER, written INTEGER, evicted INTEGER)")
+
+    self.tables = {}
+    self.storedSizes = {}
+    self.reset()
+
+  def reset(self):
+    self.hits = 0
+    self.misses = 0
+    self.loaded = 0
+    self.written = 0
+    self.evicted = 0
+
+  # In-memory table of a context, loaded from disk the first time it is used
+  def getTable(self, key):
+    if key not in self.tables:
+      row = self.connection.execute("SELECT responses FROM bestResponses WHERE key = ?", (key,)).fetchone()
+      self.tables[key] = decodeTable(row[0]) if row else {}
+      self.storedSizes[key] = len(self.tables[key])
+      self.loaded += len(self.tables[key])
+    return self.tables[key]
+
+  def countLookup(self, hit):
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+
+  # Merges the new entries into the database, evicts down to maxBytes and drops the in-memory
+  # tables. Usage counters are added to the run's row so workers can be summed up
+  def flush(self, run=None):
+    now = time.time()
+    self.connection.execute("BEGIN IMMEDIATE")
+    try:
+      for key, table in self.tables.items():
+        if len(table) == self.storedSizes[key]:
+          self.connection.execute("UPDATE bestResponses SET lastUsed = ? WHERE key = ?", (now, key))
+          continue
+
+        # Another process may have stored entries for the same context since we loaded it
+        row = self.connection.execute("SELECT responses FROM bestResponses WHERE key = ?", (key,)).fetchone()
+        merged = decodeTable(row[0]) if row else {}
+        merged.update(table)
+        responses = encodeTable(merged)
+        self.connection.execute("INSERT OR REPLACE INTO bestResponses VALUES (?, ?, ?, ?)", (key, responses, len(responses), now))
+        self.written += len(table) - self.storedSizes[key]
+
+      self.evict()
+      if run is not None:
+        self.connection.execute("INSERT OR IGNORE INTO usage VALUES (?, 0, 0, 0, 0, 0)", (str(run),))
+        self.connection.execute(
+          "UPDATE usage SET hits = hits + ?, misses = misses + ?, loaded = loaded + ?, written = written + ?, evicted = evicted + ? WHERE run = ?",
+          (self.hits, self.misses, self.loaded, self.written, self.evicted, str(run))
+        )
+        self.reset()
+      self.connection.execute("COMMIT")
+    except BaseException:
+      self.connection.execute("ROLLBACK")
+      raise
+
+    self.tables = {}
+    self.storedSizes = {}
+
+  def evict(self):
+    total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM bestResponses").fetchone()[0]
+    if total <= self.maxBytes:
+      return
+
+    for key, size in self.connection.execute("SELECT key, size FROM bestResponses ORDER BY lastUsed").fetchall():
+      if total <= self.maxBytes:
+        break
+      self.connection.execute("DELETE FROM bestResponses WHERE key = ?", (key,))
+      total -= size
+      self.evicted += 1
+
+  def getUsage(self, run):
+    row = self.connection.execute("SELECT hits, misses, loaded, written, evicted FROM usage WHERE run = ?", (str(run),)).fetchone()
+    usage = dict(zip(["hits", "misses", "loaded", "written", "evicted"], row or [0] * 5))
+    lookups = usage["hits"] + usage["misses"]
+    usage["hitRate"] = usage["hits"] / lookups if lookups else None
+    return usage
+
+  def close(self):
+    self.connection.close()
+
+# Identifies the best-response table of players[index]
+# top_level only matters for RelaxedInformationPlayer, which searches a subset when nested
+def getCacheKey(players, index, top_level=None):
+  grid = players[index].possiblePredictions
+  context = {
+    "c": rules.c,
+    "grid": [len(grid), grid[0], grid[-1], hashlib.sha256(json.dumps(grid).encode()).hexdigest()],
+    "players": [[type(player).__name__, player.weight, player.rule, player.p, getattr(player, "radius", None)] for player in players[index:]],
+    "topLevel": top_level
+  }
+  return hashlib.sha256(json.dumps(context).encode()).hexdigest()
+
+# Partial sums are stored as float.hex so they come back as the exact same floats
+def encodeTable(table):
+  return json.dumps({float(key).hex(): value for key, value in table.items()})
+
+def decodeTable(responses):
+  return {float.fromhex(key): value for key, value in json.loads(responses).items()}
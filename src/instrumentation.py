@@ -0,0 +1,130 @@
+import time
+from contextlib import contextmanager
+
+# Optional counters and timers for the hot paths: predict, calculateScore and simulate
+# Off by default. Call sites check `stats.enabled` before recording anything, so a
+# disabled run only pays for an attribute lookup
+#
+# Notebook usage:
+#   from src.instrumentation import stats
+#   with stats.instrument():
+#     simulate(players, q, solver)
+#   stats.records  # one dict per simulate() call
+class Instrumentation:
+  def __init__(self):
+    self.enabled = False
+    self.records = []
+    self.reset()
+
+  def reset(self):
+    self.q = None
+    self.startTime = None
+    self.predictCalls = {}
+    self.scoreEvaluations = 0
+    self.cacheHits = 0
+    self.cacheMisses = 0
+    self.searchedCandidates = 0
+    self.prunedCandidates = 0
+    self.depth = 0
+    self.maxDepth = 0
+
+  def enable(self):
+    self.enabled = True
+
+  def disable(self):
+    self.enabled = False
+
+  @contextmanager
+  def instrument(self):
+    self.enable()
+    try:
+      yield self
+    finally:
+      self.disable()
+
+  def beginQ(self, q):
+    self.reset()
+    self.q = q
+    self.startTime = time.perf_counter()
+
+  def endQ(self):
+    lookups = self.cacheHits + self.cacheMisses
+    self.records.append({
+      "q": self.q,
+      "time": time.perf_counter() - self.startTime,
+      "predictCalls": [self.predictCalls.get(i, 0) for i in range(max(self.predictCalls, default=-1) + 1)],
+      "scoreEvaluations": self.scoreEvaluations,
+      "maxDepth": self.maxDepth,
+      "cacheHits": self.cacheHits,
+      "cacheMisses": self.cacheMisses,
+      "cacheHitRate": self.cacheHits / lookups if lookups else None,
+      "searchedCandidates": self.searchedCandidates,
+      "prunedCandidates": self.prunedCandidates
+    })
+
+  def enterPredict(self, index):
+    self.predictCalls[index] = self.predictCalls.get(index, 0) + 1
+    self.depth += 1
+    self.maxDepth = max(self.maxDepth, self.depth)
+
+  def exitPredict(self):
+    self.depth -= 1
+
+  def countScores(self, count):
+    self.scoreEvaluations += count
+
+  # Candidates a branch and bound solved and skipped
+  def countPruning(self, searched, pruned):
+    self.searchedCandidates += searched
+    self.prunedCandidates += pruned
+
+  def countCache(self, hit):
+    if hit:
+      self.cacheHits += 1
+    else:
+      self.cacheMisses += 1
+
+  # Returns and clears the records collected so far
+  def collect(self):
+    records = self.records
+    self.records = []
+    return records
+
+  def summary(self, records=None):
+    records = self.records if records is None else records
+    hits = sum(record["cacheHits"] for record in records)
+    lookups = hits + sum(record["cacheMisses"] for record in records)
+    searched = sum(record.get("searchedCandidates", 0) for record in records)
+    pruned = sum(record.get("prunedCandidates", 0) for record in records)
+    return {
+      "time": sum(record["time"] for record in records),
+      "predictCalls": sum(sum(record["predictCalls"]) for record in records),
+      "scoreEvaluations": sum(record["scoreEvaluations"] for record in records),
+      "maxDepth": max((record["maxDepth"] for record in records), default=0),
+      "cacheHitRate": hits / lookups if lookups else None,
+      "pruneRate": pruned / (searched + pruned) if searched + pruned else None
+    }
+
+# Merge the records of several simulate() calls for the same q (replications)
+def mergeRecords(records):
+  if not records:
+    return None
+
+  width = max(len(record["predictCalls"]) for record in records)
+  hits = sum(record["cacheHits"] for record in records)
+  misses = sum(record["cacheMisses"] for record in records)
+  return {
+    "q": records[0]["q"],
+    "time": sum(record["time"] for record in records),
+    "predictCalls": [sum(record["predictCalls"][i] for record in records if i < len(record["predictCalls"])) for i in range(width)],
+    "scoreEvaluations": sum(record["scoreEvaluations"] for record in records),
+    "maxDepth": max(record["maxDepth"] for record in records),
+    "cacheHits": hits,
+    "cacheMisses": misses,
+    "cacheHitRate": hits / (hits + misses) if hits + misses else None,
+    "searchedCandidates": sum(record.get("searchedCandidates", 0) for record in records),
+    "prunedCandidates": sum(record.get("prunedCandidates", 0) for record in records),
+    "simulations": len(records)
+  }
+
+stats = Instrumentation()
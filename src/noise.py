@@ -1,33 +1,52 @@
 import numpy as np
 
-def get_noisy_q(q, noiseFn, epsilon):
+# rng is an optional np.random.Generator; the global np.random state is used otherwise
+def get_noisy_q(q, noiseFn, epsilon, rng=None):
   if noiseFn == "gaussian":
-    return add_gaussian_noise(q, epsilon)
+    return add_gaussian_noise(q, epsilon, rng)
   elif noiseFn == "uniform":
-    return add_uniform_noise(q, epsilon)
+    return add_uniform_noise(q, epsilon, rng)
   elif noiseFn == "sinusoidal":
     return add_sinusoidal_noise(q, epsilon)
   elif noiseFn == "exponential":
-    return add_exponential_noise(q, epsilon)
+    return add_exponential_noise(q, epsilon, rng)
   else:
     return identity(q)
 
+# Vectorized get_noisy_q: draws a whole array of noisy beliefs in one call
+# q must broadcast against shape, e.g. shape (replications, len(qValues), n) with q of shape (1, len(qValues), 1)
+def get_noisy_q_batch(q, noiseFn, epsilon, shape, rng):
+  q = np.broadcast_to(np.asarray(q, dtype=float), shape)
+
+  if noiseFn == "gaussian":
+    noise = rng.normal(0, epsilon, size=shape)
+  elif noiseFn == "uniform":
+    noise = rng.uniform(-epsilon, epsilon, size=shape)
+  elif noiseFn == "sinusoidal":
+    noise = epsilon * np.sin(2 * np.pi * q)
+  elif noiseFn == "exponential":
+    noise = rng.exponential(epsilon, size=shape)
+  else:
+    return q.copy()
+
+  return np.clip(q + noise, 0, 1).round(2)
+
 def identity(q):
   return q
 
-def add_gaussian_noise(q, epsilon):
+def add_gaussian_noise(q, epsilon, rng=None):
   """
   Add Gaussian noise to the q value.
   """
-  noise = np.random.normal(0, epsilon)
+  noise = (rng or np.random).normal(0, epsilon)
   noisy_q = q + noise
   return float(np.clip(noisy_q, 0, 1).round(2))
 
-def add_uniform_noise(q, epsilon):
+def add_uniform_noise(q, epsilon, rng=None):
   """
   Add uniform noise to the q value.
   """
-  noise = np.random.uniform(-epsilon, epsilon)
+  noise = (rng or np.random).uniform(-epsilon, epsilon)
   noisy_q = q + noise
   return float(np.clip(noisy_q, 0, 1).round(2))
 
@@ -39,11 +58,11 @@ def add_sinusoidal_noise(q, epsilon, frequency=1.0):
   noisy_q = q + noise
   return float(np.clip(noisy_q, 0, 1).round(2))
 
-def add_exponential_noise(q, epsilon):
+def add_exponential_noise(q, epsilon, rng=None):
   """
   Add exponential noise to the q value.
   """
-  noise = np.random.exponential(epsilon)
+  noise = (rng or np.random).exponential(epsilon)
   noisy_q = q + noise
   return float(np.clip(noisy_q, 0, 1).round(2))
 
@@ -1,8 +1,22 @@
 from abc import ABC, abstractmethod
+import logging
 import math
 import numpy as np
 
-from .rules import calculateScore, f
+from . import rules
+from .instrumentation import stats
+from .rules import calculateScore, calculateScoreUpperBound, calculateScoreVector, f, fVector
+
+logger = logging.getLogger(__name__)
+
+# Pick the first prediction with the highest score, keeping 0 unless it beats maxScore
+# Same outcome as scanning with `if currentScore > maxScore`
+def selectBestPrediction(possiblePredictions, scores, maxScore):
+  best = int(np.argmax(scores))
+  if scores[best] > maxScore:
+    return possiblePredictions[best]
+  return 0
+
 class Player(ABC):
   def __init__(self, index, weight, rule, p, possiblePredictions):
     self.index = index
@@ -10,60 +24,140 @@ class Player(ABC):
     self.rule = rule
     self.p = p
     self.possiblePredictions = possiblePredictions
+    self.predictionsArray = np.array(possiblePredictions, dtype=float)
+    self.cache = None
+    self.cachedResponses = None
+
+  # Reads and records best responses in the persistent table of this player's context
+  # (imported here so runs without a cache don't load sqlite3)
+  def useCache(self, cache, players):
+    from .cache import getCacheKey
+    self.cache = cache
+    self.cachedResponses = cache.getTable(getCacheKey(players, self.index))
+
+  # Weighted sum of the predictions made before this player
+  def getCurrentPrediction(self, players, predictions):
+    if self.index == 0:
+      return 0
+
+    result = sum(predictions[i] * players[i].weight for i in range(self.index))
+    return result
 
-  @abstractmethod
   def predict(self, players, predictions):
+    return self.bestResponse(players, self.getCurrentPrediction(players, predictions))
+
+  # Optimistic score of every prediction of the grid: the score with f anywhere in the range the
+  # later players can reach by predicting anything on their grids. The exactness certificate of
+  # the branch and bound of PerfectInformationPlayer and of the solvers' narrowed searches
+  def getScoreUpperBounds(self, players, currentPrediction):
+    laterPlayers = players[self.index + 1:]
+    lowLater = sum(other.weight * other.predictionsArray[0] for other in laterPlayers)
+    highLater = sum(other.weight * other.predictionsArray[-1] for other in laterPlayers)
+
+    # Widened slightly so float summation order can't push f across a rounding boundary
+    partialPredictions = currentPrediction + (self.weight * self.predictionsArray)
+    lowF = fVector(partialPredictions + lowLater - 1e-9, self.p)
+    highF = fVector(partialPredictions + highLater + 1e-9, self.p)
+    return calculateScoreUpperBound(self.predictionsArray, lowF, highF, self.rule)
+
+  # Best prediction given the weighted sum of the predictions made before this player
+  # Later players only depend on that partial sum plus our own prediction, so the
+  # recursion passes floats down instead of copying the predictions list at every level
+  @abstractmethod
+  def bestResponse(self, players, currentPrediction):
     pass
 
 # Implementation of Tomas Schitter PerfectInformationPlayer
 # Assumes that all players have perfect information about the other players' predictions
 # and that they know the true final probability
+# With prune=True the search of non-last players is a branch and bound (see branchAndBound)
 class PerfectInformationPlayer(Player):
-  def getCurrentPrediction(self, players, predictions):
-    if self.index == 0:
-      return 0
-
-    result = sum(predictions[i] * players[i].weight for i in range(self.index))
-    return result
+  def __init__(self, index, weight, rule, p, possiblePredictions, prune=False):
+    super().__init__(index, weight, rule, p, possiblePredictions)
+    self.prune = prune
+    # Predictions nearest to p first: the likely optimum sets a high incumbent early
+    self.searchOrder = np.argsort(np.abs(self.predictionsArray - p), kind="stable").tolist()
+
+  def bestResponse(self, players, currentPrediction):
+    responses = self.cachedResponses
+    if responses is not None:
+      hit = currentPrediction in responses
+      self.cache.countLookup(hit)
+      if hit:
+        return responses[currentPrediction]
 
-  def predict(self, players, predictions):
     n = len(players)
-    _predictions = predictions.copy()
-    bestPrediction = 0
+    if stats.enabled:
+      stats.enterPredict(self.index)
 
     if self.index == n - 1:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
       maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
 
-      for prediction in self.possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
-
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
+      finalPredictions = currentPrediction + (self.weight * self.predictionsArray)
+      scores = calculateScoreVector(self.predictionsArray, fVector(finalPredictions, self.p), self.rule)
 
-      return bestPrediction
+      bestPrediction = selectBestPrediction(self.possiblePredictions, scores, maxScore)
+    elif self.prune:
+      maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
+      bestPrediction = self.branchAndBound(players, currentPrediction, maxScore)
     else:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
       maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
 
+      finalPredictions = []
       for prediction in self.possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
+        # Every later player sees the same partial sum: the current one plus our prediction
+        partialPrediction = currentPrediction + (self.weight * prediction)
+        finalPrediction = partialPrediction
 
         for j in range(self.index + 1, n):
-          otherPrediction = players[j].predict(players, _predictions) * players[j].weight
+          otherPrediction = players[j].bestResponse(players, partialPrediction) * players[j].weight
           finalPrediction += otherPrediction
 
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
+        finalPredictions.append(finalPrediction)
+
+      scores = calculateScoreVector(self.predictionsArray, fVector(finalPredictions, self.p), self.rule)
 
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
+      bestPrediction = selectBestPrediction(self.possiblePredictions, scores, maxScore)
 
-      return bestPrediction
+    if responses is not None:
+      responses[currentPrediction] = bestPrediction
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
+
+  # Same result as scanning the whole grid, but a prediction is only solved (recursing into
+  # every later player) if its optimistic score could still win: the score with f anywhere in
+  # the range the later players can reach by predicting anything on their grids
+  def branchAndBound(self, players, currentPrediction, maxScore):
+    n = len(players)
+    upperBounds = self.getScoreUpperBounds(players, currentPrediction).tolist()
+
+    # Like selectBestPrediction: highest score, lowest index on ties, only if it beats maxScore
+    bestIndex = None
+    bestScore = maxScore
+    searched = 0
+    for i in self.searchOrder:
+      bound = upperBounds[i]
+      if bound < bestScore or (bound == bestScore and (bestIndex is None or i > bestIndex)):
+        continue
+      searched += 1
+
+      prediction = self.possiblePredictions[i]
+      partialPrediction = currentPrediction + (self.weight * prediction)
+      finalPrediction = partialPrediction
+
+      for j in range(self.index + 1, n):
+        otherPrediction = players[j].bestResponse(players, partialPrediction) * players[j].weight
+        finalPrediction += otherPrediction
+
+      score = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
+      if score > bestScore or (score == bestScore and bestIndex is not None and i < bestIndex):
+        bestIndex = i
+        bestScore = score
+
+    if stats.enabled:
+      stats.countPruning(searched, len(self.searchOrder) - searched)
+    return self.possiblePredictions[bestIndex] if bestIndex is not None else 0
 
 # Implementation of a modified PerfectInformationPlayer
 # Assumes all players predict within a certain radius of their p
@@ -71,75 +165,157 @@ class PerfectInformationPlayer(Player):
 class RelaxedInformationPlayer(Player):
   def __init__(self, index, weight, rule, p, possiblePredictions, radius):
     super().__init__(index, weight, rule, p, possiblePredictions)
-    self.subset = self.getSubsetWithinRadius(radius)
-    print(self.subset)
+    self.radius = radius
+    self.subsetRange = self.getSubsetRange(radius)
+    self.subset = self.possiblePredictions[slice(*self.subsetRange)]
+    self.subsetArray = self.predictionsArray[slice(*self.subsetRange)]
+    logger.debug("Player %d subset: %s", index, self.subset)
+
+  # The full grid (top level) and the subset (nested) give different tables
+  def useCache(self, cache, players):
+    from .cache import getCacheKey
+    self.cache = cache
+    self.cachedResponses = {top_level: cache.getTable(getCacheKey(players, self.index, top_level)) for top_level in (True, False)}
+
+  # Index range [start, end) of the predictions within a radius of the current p
+  # The grid is sorted, so the closest prediction is found by bisection; ties go to the lower
+  # one, as with argmin
+  def getSubsetRange(self, radius):
+    closest_index = int(np.searchsorted(self.predictionsArray, self.p))
+    if closest_index == len(self.predictionsArray) or (closest_index > 0 and abs(self.predictionsArray[closest_index - 1] - self.p) <= abs(self.predictionsArray[closest_index] - self.p)):
+      closest_index -= 1
 
-  def getCurrentPrediction(self, players, predictions):
-    if self.index == 0:
-      return 0
-
-    result = sum(predictions[i] * players[i].weight for i in range(self.index))
-    return result
+    start_index = max(0, closest_index - radius)
+    end_index = min(len(self.possiblePredictions), closest_index + radius + 1)
+    return start_index, end_index
 
   # Get a subset of possible predictions within a radius of the current p
   # Example: p = 0.4, radius = 1
   # Returns: [0.39, 0.4, 0.41]
   def getSubsetWithinRadius(self, radius):
-    closest_index = np.argmin(np.abs(np.array(self.possiblePredictions) - self.p))
-
-    start_index = max(0, closest_index - radius)
-    end_index = min(len(self.possiblePredictions), closest_index + radius + 1)
+    return self.possiblePredictions[slice(*self.getSubsetRange(radius))]
 
-    subset = self.possiblePredictions[start_index:end_index]
+  def predict(self, players, predictions, top_level=True):
+    return self.bestResponse(players, self.getCurrentPrediction(players, predictions), top_level)
 
-    return subset
+  def bestResponse(self, players, currentPrediction, top_level=True):
+    responses = self.cachedResponses[top_level] if self.cachedResponses is not None else None
+    if responses is not None:
+      hit = currentPrediction in responses
+      self.cache.countLookup(hit)
+      if hit:
+        return responses[currentPrediction]
 
-  def predict(self, players, predictions, top_level=True):
     n = len(players)
-    _predictions = predictions.copy()
-    bestPrediction = 0
+    if stats.enabled:
+      stats.enterPredict(self.index)
 
     if self.index == n - 1:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
       maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
 
       possiblePredictions = self.possiblePredictions
+      predictionsArray = self.predictionsArray
       if not top_level:
         possiblePredictions = self.subset
+        predictionsArray = self.subsetArray
 
-      for prediction in possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
-
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
+      finalPredictions = currentPrediction + (self.weight * predictionsArray)
+      scores = calculateScoreVector(predictionsArray, fVector(finalPredictions, self.p), self.rule)
 
-      return bestPrediction
+      bestPrediction = selectBestPrediction(possiblePredictions, scores, maxScore)
     else:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
       maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
 
       possiblePredictions = self.possiblePredictions
+      predictionsArray = self.predictionsArray
       if not top_level:
         possiblePredictions = self.subset
-      
+        predictionsArray = self.subsetArray
+
+      finalPredictions = []
       for prediction in possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
+        partialPrediction = currentPrediction + (self.weight * prediction)
+        finalPrediction = partialPrediction
 
         for j in range(self.index + 1, n):
-          otherPrediction = players[j].predict(players, _predictions, top_level=False) * players[j].weight
+          otherPrediction = players[j].bestResponse(players, partialPrediction, top_level=False) * players[j].weight
+          finalPrediction += otherPrediction
+
+        finalPredictions.append(finalPrediction)
+
+      scores = calculateScoreVector(predictionsArray, fVector(finalPredictions, self.p), self.rule)
+
+      bestPrediction = selectBestPrediction(possiblePredictions, scores, maxScore)
+
+    if responses is not None:
+      responses[currentPrediction] = bestPrediction
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
+
+# PerfectInformationPlayer with a depth-limited lookahead, for markets too large to solve exactly
+# Only the next `lookahead` players are solved exactly. The players after them are replaced by a
+# mean-field estimate of their aggregate weighted prediction: each of them predicts about the
+# final probability c * market + (1 - c) * p, and the market includes the aggregate itself, so
+# it is the fixed point T = c * W * (s + T) + (1 - c) * P for the sum s of the predictions up to
+# the end of the window, the tail's total weight W and weighted belief P (the rounding of f is
+# ignored). Players inside the window only look ahead to its end, so a best response costs
+# about G ** (lookahead + 1) score evaluations however many players follow. With
+# lookahead >= n - 1 it plays like PerfectInformationPlayer
+class MeanFieldPlayer(Player):
+  def __init__(self, index, weight, rule, p, possiblePredictions, lookahead=1):
+    super().__init__(index, weight, rule, p, possiblePredictions)
+    self.lookahead = lookahead
+    self.tails = {}
+    self.responses = {}
+
+  # Aggregate weighted prediction of the players after horizon, for each sum of the predictions
+  # up to horizon
+  def getMeanField(self, players, horizon, partialPredictions):
+    if horizon not in self.tails:
+      tail = players[horizon + 1:]
+      self.tails[horizon] = (sum(other.weight for other in tail), sum(other.weight * other.p for other in tail))
+
+    tailWeight, tailBelief = self.tails[horizon]
+    if tailWeight == 0:
+      return 0.0
+    return (rules.c * tailWeight * partialPredictions + (1 - rules.c) * tailBelief) / (1 - rules.c * tailWeight)
+
+  # horizon is the last player solved exactly, set by the top-level call for the whole window
+  def bestResponse(self, players, currentPrediction, horizon=None):
+    if horizon is None:
+      horizon = min(self.index + self.lookahead, len(players) - 1)
+    key = (horizon, currentPrediction)
+    if key in self.responses:
+      return self.responses[key]
+
+    if stats.enabled:
+      stats.enterPredict(self.index)
+
+    maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
+    if self.index == horizon:
+      partialPredictions = currentPrediction + (self.weight * self.predictionsArray)
+      finalPredictions = partialPredictions + self.getMeanField(players, horizon, partialPredictions)
+    else:
+      finalPredictions = []
+      for prediction in self.possiblePredictions:
+        # Every later player sees the same partial sum: the current one plus our prediction
+        partialPrediction = currentPrediction + (self.weight * prediction)
+        finalPrediction = partialPrediction
+
+        for j in range(self.index + 1, horizon + 1):
+          otherPrediction = players[j].bestResponse(players, partialPrediction, horizon) * players[j].weight
           finalPrediction += otherPrediction
 
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
+        finalPredictions.append(finalPrediction + self.getMeanField(players, horizon, finalPrediction))
 
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
+    scores = calculateScoreVector(self.predictionsArray, fVector(finalPredictions, self.p), self.rule)
+    bestPrediction = selectBestPrediction(self.possiblePredictions, scores, maxScore)
 
-      return bestPrediction
+    self.responses[key] = bestPrediction
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
 
 """
 Cambiar MAXSCORE por:
@@ -163,52 +339,26 @@ que los jugadores tengan una creencia de un rango en el que puedan estar todos
 Experimento 2:
 La mismo estrategia, utilizando la regla logarítmica
 """
+# The player doesn't know the p of the players after it: it assumes they all share a p drawn
+# from `belief` (a BeliefDistribution) and are otherwise perfectly informed, and predicts what
+# maximizes its expected score. engine is the ExpectedScoreEngine shared by the market
 class AverageCalculationPlayer(Player):
-  def getCurrentPrediction(self, players, predictions):
-    if self.index == 0:
-      return 0
-
-    result = sum(predictions[i] * players[i].weight for i in range(self.index))
-    return result
-
-  def predict(self, players, predictions):
-    n = len(players)
-    _predictions = predictions.copy()
-    bestPrediction = 0
-
-    if self.index == n - 1:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
-      maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
-
-      for prediction in self.possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
-
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
-
-      return bestPrediction
-    else:
-      currentPrediction = self.getCurrentPrediction(players, _predictions)
-      maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
-
-      for prediction in self.possiblePredictions:
-        _predictions[self.index] = prediction
-        finalPrediction = currentPrediction + (self.weight * prediction)
+  def __init__(self, index, weight, rule, p, possiblePredictions, belief, engine):
+    super().__init__(index, weight, rule, p, possiblePredictions)
+    self.belief = belief
+    self.engine = engine
 
-        for j in range(self.index + 1, n):
-          otherPrediction = players[j].predict(players, _predictions) * players[j].weight
-          finalPrediction += otherPrediction
+  def bestResponse(self, players, currentPrediction):
+    if stats.enabled:
+      stats.enterPredict(self.index)
 
-        currentScore = calculateScore(prediction, f(finalPrediction, self.p), self.rule)
+    maxScore = calculateScore(0, f(currentPrediction, self.p), self.rule)
+    scores = self.engine.getExpectedScores(self, currentPrediction)
+    bestPrediction = selectBestPrediction(self.possiblePredictions, scores, maxScore)
 
-        if currentScore > maxScore:
-          maxScore = currentScore
-          bestPrediction = prediction
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
 
-      return bestPrediction
-    
 # Remove assumptions
 # Make the model look more like a real scenario
@@ -1,38 +1,50 @@
 import csv
 import json
+import os
 
 class CSVResultHandler:
   def __init__(self, filename, n):
     self.n = n
     self.scores_file = f"results/{filename}-scores.csv"
     self.predictions_file = f"results/{filename}-predictions.csv"
+    self.files = None
+
+  # Both files stay open between rows instead of being reopened for every q
+  def open(self, mode="a"):
+    if self.files is None:
+      self.files = (open(self.scores_file, mode, newline=''), open(self.predictions_file, mode, newline=''))
+      self.scores_writer = csv.writer(self.files[0])
+      self.predictions_writer = csv.writer(self.files[1])
+
+  def close(self):
+    if self.files is not None:
+      for file in self.files:
+        file.close()
+      self.files = None
 
   def write_headers(self):
-    with open(self.scores_file, "w", newline='') as scores_file, open(self.predictions_file, "w", newline='') as predictions_file:
-      scores_writer = csv.writer(scores_file)
-      predictions_writer = csv.writer(predictions_file)
-      
-      scores_header = ['q'] + [f'p{i+1}' for i in range(self.n)] + ['market']
-      predictions_header = ['q'] + [f'p{i+1}' for i in range(self.n)] + ['market', 'final']
-      scores_writer.writerow(scores_header)
-      predictions_writer.writerow(predictions_header)
+    self.close()
+    self.open("w")
+
+    scores_header = ['q'] + [f'p{i+1}' for i in range(self.n)] + ['market']
+    predictions_header = ['q'] + [f'p{i+1}' for i in range(self.n)] + ['market', 'final']
+    self.scores_writer.writerow(scores_header)
+    self.predictions_writer.writerow(predictions_header)
 
   def write_results(self, q, scores, predictions, finalPrediction, marketPrediction, score):
-    with open(self.scores_file, "a", newline='') as scores_file, open(self.predictions_file, "a", newline='') as predictions_file:
-      scores_writer = csv.writer(scores_file)
-      predictions_writer = csv.writer(predictions_file)
+    self.open()
 
-      score_row = [f'{q:.2f}'] + [f'{round(score, 4):.4f}' for score in scores] + [f'{score:.4f}']
-      prediction_row = [f'{q:.2f}'] + [f'{round(prediction, 2):.2f}' for prediction in predictions] + [f'{round(marketPrediction, 2):.2f}', f'{round(finalPrediction, 2):.2f}']
+    score_row = [f'{q:.2f}'] + [f'{round(score, 4):.4f}' for score in scores] + [f'{score:.4f}']
+    prediction_row = [f'{q:.2f}'] + [f'{round(prediction, 2):.2f}' for prediction in predictions] + [f'{round(marketPrediction, 2):.2f}', f'{round(finalPrediction, 2):.2f}']
 
-      scores_writer.writerow(score_row)
-      predictions_writer.writerow(prediction_row)
+    self.scores_writer.writerow(score_row)
+    self.predictions_writer.writerow(prediction_row)
 
 class JSONResultHandler:
   def __init__(self, filename):
     self.filename = f"results/{filename}.json"
 
-  def write_results(self, config, scores, predictions, finalPrediction, marketPrediction, score):
+  def write_results(self, config, scores, predictions, finalPrediction, marketPrediction, score, instrumentation=None, verification=None):
     results = {
       "config": config,
       "scores": scores,
@@ -41,7 +53,123 @@ class JSONResultHandler:
       "marketPrediction": marketPrediction,
       "score": score
     }
+    if instrumentation is not None:
+      results["instrumentation"] = instrumentation
+    if verification is not None:
+      results["verification"] = verification
         
     with open(self.filename, 'w') as json_file:
       json.dump(results, json_file, indent=2)
 
+  # Statistics over noisy replications: mean, variance and quantiles per q
+  def write_statistics(self, config, statistics, instrumentation=None, verification=None):
+    results = {
+      "config": config,
+      "statistics": statistics
+    }
+    if instrumentation is not None:
+      results["instrumentation"] = instrumentation
+    if verification is not None:
+      results["verification"] = verification
+
+    with open(self.filename, 'w') as json_file:
+      json.dump(results, json_file, indent=2)
+
+  # Consolidated JSON for a run streamed through JSONLinesResultHandler
+  # Records written in ticks by TickSolver are converted back to floats with their TickGrid
+  def write_records(self, config, records, grid=None):
+    if grid is not None and not config.get("replications"):
+      records = [grid.toFloats(record) for record in records]
+
+    instrumentation = None
+    if any("instrumentation" in record for record in records):
+      instrumentation = [record.get("instrumentation") for record in records]
+    verification = None
+    if any("verification" in record for record in records):
+      verification = [record.get("verification") for record in records]
+
+    if config.get("replications"):
+      statistics = {"q": [record["q"] for record in records]}
+      for name in ["beliefs", "scores", "predictions", "finalPrediction", "marketPrediction", "score"]:
+        statistics[name] = {key: [record[name][key] for record in records] for key in ["mean", "variance"]}
+        if name != "beliefs":
+          statistics[name]["quantiles"] = {quantile: [record[name]["quantiles"][quantile] for record in records] for quantile in records[0][name]["quantiles"]} if records else {}
+      self.write_statistics(config, statistics, instrumentation, verification)
+    else:
+      self.write_results(config, *([record[name] for record in records] for name in ["scores", "predictions", "finalPrediction", "marketPrediction", "score"]), instrumentation, verification)
+
+# Streaming sink: one JSON record per line, appended as soon as each q is solved
+# The first line holds the config. Records are buffered and flushed to disk every
+# buffer_size records, so a crash loses at most one buffer and the write cost per q
+# doesn't grow with the sweep
+class JSONLinesResultHandler:
+  def __init__(self, filename, buffer_size=8):
+    self.filename = f"results/{filename}.jsonl"
+    self.buffer_size = buffer_size
+    self.buffer = []
+    self.file = None
+
+  def exists(self):
+    return os.path.exists(self.filename)
+
+  # Returns the config and records on disk, dropping a partial last line left by a crash
+  def read_records(self, truncate=False):
+    config = None
+    records = []
+    valid_size = 0
+
+    with open(self.filename, "rb") as jsonl_file:
+      for line in jsonl_file:
+        try:
+          record = json.loads(line)
+        except json.JSONDecodeError:
+          break
+        if not line.endswith(b"\n"):
+          break
+
+        valid_size += len(line)
+        if "config" in record:
+          config = record["config"]
+        else:
+          records.append(record)
+
+    if truncate and valid_size < os.path.getsize(self.filename):
+      os.truncate(self.filename, valid_size)
+
+    return config, records
+
+  def open(self, config, resume=False):
+    if resume and self.exists():
+      stored_config, records = self.read_records(truncate=True)
+      self.file = open(self.filename, "a")
+      return stored_config, records
+
+    self.file = open(self.filename, "w")
+    self.buffer.append(json.dumps({"config": config}))
+    self.flush()
+    return config, []
+
+  def write_record(self, record):
+    self.buffer.append(json.dumps(record))
+    if len(self.buffer) >= self.buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.buffer:
+      self.file.write("\n".join(self.buffer) + "\n")
+      self.buffer = []
+    self.file.flush()
+    os.fsync(self.file.fileno())
+
+  def close(self):
+    if self.file is not None:
+      self.flush()
+      self.file.close()
+      self.file = None
+
+  # Closes the file without writing the buffered records, for a run whose file was taken over
+  def discard(self):
+    self.buffer = []
+    if self.file is not None:
+      self.file.close()
+      self.file = None
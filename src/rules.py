@@ -1,6 +1,8 @@
 import numpy as np
 import math
 
+from .instrumentation import stats
+
 c = 0.1
 
 def logRule(p, q):
@@ -20,9 +22,69 @@ def f(p, q):
   return round((c * p + (1 - c) * q), 2)
 
 def calculateScore(p_i, realFinalProbability, rule):
+  if stats.enabled:
+    stats.countScores(1)
+
   if rule == "log":
     return logRule(p_i, realFinalProbability)
   elif rule == "brier":
     return brierRule(p_i, realFinalProbability)
   else:
-    return quadraticError(p_i, realFinalProbability)
\ No newline at end of file
+    return quadraticError(p_i, realFinalProbability)
+
+# Array versions of the rules above: score a whole grid of predictions in a single call
+# They reproduce the scalar functions bit for bit (float_power matches the ** of a Python
+# float and fVector falls back to round() on .005 boundaries), so argmax ties are kept
+def logRuleVector(p, q):
+  p, q = np.broadcast_arrays(np.asarray(p, dtype=float), np.asarray(q, dtype=float))
+
+  with np.errstate(divide="ignore", invalid="ignore"):
+    scores = np.round(q * np.log(p) + (1 - q) * np.log(1 - p), 4)
+
+  extremeQ = (q == 0) | (q == 1)
+  scores = np.where((p == 0) | (p == 1), np.where(extremeQ, scores, -math.inf), scores)
+  return np.where((q == p) & extremeQ, 0.0, scores)
+
+def brierRuleVector(p, q):
+  p = np.asarray(p, dtype=float)
+  q = np.asarray(q, dtype=float)
+  return -(q * np.float_power(1 - p, 2) + (1 - q) * np.float_power(p, 2))
+
+def quadraticErrorVector(p, q):
+  p = np.asarray(p, dtype=float)
+  q = np.asarray(q, dtype=float)
+  return -np.float_power(p - q, 2)
+
+def fVector(p, q):
+  values = c * np.asarray(p, dtype=float) + (1 - c) * np.asarray(q, dtype=float)
+  rounded = np.round(values, 2)
+
+  # np.round scales by 100 before rounding, which disagrees with round() when the
+  # value sits next to a .005 boundary
+  scaled = values * 100
+  boundary = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+  if boundary.any():
+    rounded[boundary] = [round(value, 2) for value in values[boundary].tolist()]
+
+  return rounded
+
+def calculateScoreVector(p_i, realFinalProbability, rule):
+  if stats.enabled:
+    stats.countScores(np.broadcast(p_i, realFinalProbability).size)
+
+  if rule == "log":
+    return logRuleVector(p_i, realFinalProbability)
+  elif rule == "brier":
+    return brierRuleVector(p_i, realFinalProbability)
+  else:
+    return quadraticErrorVector(p_i, realFinalProbability)
+
+# Highest score a prediction can get when the real final probability is anywhere in
+# [lowFinalProbability, highFinalProbability]. brier and log are linear in it and
+# quadraticError peaks where it equals the prediction, so the bound is exact
+def calculateScoreUpperBound(p_i, lowFinalProbability, highFinalProbability, rule):
+  if rule in ("log", "brier"):
+    low = calculateScoreVector(p_i, lowFinalProbability, rule)
+    high = calculateScoreVector(p_i, highFinalProbability, rule)
+    return np.maximum(low, high)
+  return calculateScoreVector(p_i, np.clip(p_i, lowFinalProbability, highFinalProbability), rule)
@@ -1,14 +1,34 @@
+import time
+
+from .instrumentation import stats
 from .rules import calculateScore, f
 
-def simulate(players, q):
+# If timings is a list, the wall time of each player's predict call is appended to it
+def simulate(players, q, solver=None, timings=None):
   predictions = [0 for _ in range(len(players))]
+  # Weighted sum of the predictions made so far: the partial sum the next player responds to
+  currentPrediction = 0.0
+  if stats.enabled:
+    stats.beginQ(q)
 
   for player in players:
-    p = player.predict(players, predictions.copy())
+    start_time = time.perf_counter()
+    if solver is None:
+      p = player.bestResponse(players, currentPrediction)
+    else:
+      p = solver.bestResponse(player.index, currentPrediction)
     predictions[player.index] = p
+    # Accumulated in player order, so it is the same float getCurrentPrediction computes
+    currentPrediction = currentPrediction + p * player.weight
+
+    if timings is not None:
+      timings.append(time.perf_counter() - start_time)
 
-  marketPrediction = sum(player.weight * predictions[i] for i, player in enumerate(players))
+  marketPrediction = currentPrediction
   finalPrediction = f(marketPrediction, q)
   scores = [calculateScore(predictions[i], finalPrediction, player.rule) for i, player in enumerate(players)]
 
-  return scores, predictions, finalPrediction, marketPrediction
\ No newline at end of file
+  if stats.enabled:
+    stats.endQ()
+
+  return scores, predictions, finalPrediction, marketPrediction
@@ -0,0 +1,469 @@
+import math
+import sys
+import numpy as np
+
+from . import rules
+from .instrumentation import stats
+from .rules import calculateScore, calculateScoreVector, f, fVector
+from .player import selectBestPrediction
+
+# Dynamic-programming engine for PerfectInformationPlayer
+# A player only sees its index and the weighted partial sum of the predictions
+# made before it (getCurrentPrediction), so its best response is a function of
+# (index, partial sum). Memoizing on that pair turns the exponential recursion
+# of PerfectInformationPlayer.predict into a polynomial backward induction
+# while reproducing exactly the same predictions.
+# With a BestResponseCache the memo tables are the persistent ones, so best responses solved
+# by earlier runs are reused and new ones are stored
+class MemoizedSolver:
+  def __init__(self, players, cache=None):
+    self.players = players
+    self.n = len(players)
+    self.cache = cache
+    if cache is None:
+      self.bestResponses = [{} for _ in range(self.n)]
+    else:
+      # Imported here so runs without a cache don't load sqlite3
+      from .cache import getCacheKey
+      self.bestResponses = [cache.getTable(getCacheKey(players, i)) for i in range(self.n)]
+
+  def bestResponse(self, index, currentPrediction):
+    bestResponses = self.bestResponses[index]
+    hit = currentPrediction in bestResponses
+    if self.cache is not None:
+      self.cache.countLookup(hit)
+    if hit:
+      if stats.enabled:
+        stats.countCache(True)
+      return bestResponses[currentPrediction]
+
+    if stats.enabled:
+      stats.countCache(False)
+      stats.enterPredict(index)
+
+    player = self.players[index]
+    maxScore = calculateScore(0, f(currentPrediction, player.p), player.rule)
+    bestPrediction = self.search(player, currentPrediction, maxScore)
+
+    bestResponses[currentPrediction] = bestPrediction
+
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
+
+  # Final market prediction reached when the player predicts each of the given predictions
+  # and every later player best-responds to the resulting partial sum
+  def getFinalPredictions(self, player, currentPrediction, predictions):
+    if player.index == self.n - 1:
+      return currentPrediction + (player.weight * np.asarray(predictions, dtype=float))
+
+    # Python floats keep the partial sums (memo keys) and the round() in f identical to the
+    # recursive path; numpy scalars would round with np.round instead
+    finalPredictions = []
+    for prediction in np.asarray(predictions, dtype=float).tolist():
+      # Every later player sees the same partial sum: the current one plus our prediction
+      partialPrediction = currentPrediction + (player.weight * prediction)
+      finalPrediction = partialPrediction
+
+      for j in range(player.index + 1, self.n):
+        otherPrediction = self.bestResponse(j, partialPrediction) * self.players[j].weight
+        finalPrediction += otherPrediction
+
+      finalPredictions.append(finalPrediction)
+
+    return finalPredictions
+
+  def getScores(self, player, currentPrediction, predictions):
+    finalPredictions = self.getFinalPredictions(player, currentPrediction, predictions)
+    return calculateScoreVector(predictions, fVector(finalPredictions, player.p), player.rule)
+
+  # Full scan of the prediction grid
+  def search(self, player, currentPrediction, maxScore):
+    scores = self.getScores(player, currentPrediction, player.predictionsArray)
+    return selectBestPrediction(player.possiblePredictions, scores, maxScore)
+
+  def predict(self, player, predictions):
+    currentPrediction = player.getCurrentPrediction(self.players, predictions)
+    return self.bestResponse(player.index, currentPrediction)
+
+INVERSE_GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+
+# MemoizedSolver with cheaper searches for the concave rules (brier, quadratic)
+# Ignoring the 2-decimal rounding of f, a player's score is a concave quadratic in its own
+# prediction x: with a = c * currentPrediction + (1 - c) * p and b = c * weight, f = a + b * x and
+#   brier:     -a + (2a - b) x - (1 - 2b) x^2
+#   quadratic: -((1 - b) x - a)^2
+# - The last player takes the closed-form optimum and only scans the grid points around it
+#   that the rounding of f could still make optimal, so its prediction stays exact
+# - Earlier players run a golden-section search over the grid. The rounding in f and the
+#   step-shaped best responses of later players make that score only roughly unimodal, so
+#   the result is then certified: every prediction whose optimistic score (f anywhere in its
+#   feasible range) could still beat it is evaluated too, keeping the result exact
+# - logRule is unbounded at 0 and 1 and always falls back to the full scan
+class AnalyticSolver(MemoizedSolver):
+  def __init__(self, players, cache=None, refineRadius=2):
+    super().__init__(players, cache)
+    self.refineRadius = refineRadius
+
+  def search(self, player, currentPrediction, maxScore):
+    if player.rule not in ("brier", "quadratic"):
+      return super().search(player, currentPrediction, maxScore)
+
+    if player.index == self.n - 1:
+      return self.closedFormSearch(player, currentPrediction, maxScore)
+    return self.goldenSectionSearch(player, currentPrediction, maxScore)
+
+  def closedFormSearch(self, player, currentPrediction, maxScore):
+    a = rules.c * currentPrediction + (1 - rules.c) * player.p
+    b = rules.c * player.weight
+
+    # Smooth score, its curvature and how much rounding f to 2 decimals can move it
+    if player.rule == "brier":
+      smoothScore = lambda x: -a + (2 * a - b) * x - (1 - 2 * b) * x ** 2
+      curvature = 1 - 2 * b
+      optimum = (2 * a - b) / (2 * curvature)
+      roundingError = 0.005
+    else:
+      smoothScore = lambda x: -((1 - b) * x - a) ** 2
+      curvature = (1 - b) ** 2
+      optimum = a / (1 - b)
+      roundingError = 0.01
+
+    predictionsArray = player.predictionsArray
+    optimum = min(max(optimum, predictionsArray[0]), predictionsArray[-1])
+    nearest = predictionsArray[np.argmin(np.abs(predictionsArray - optimum))]
+
+    # Outside this radius the smooth score is low enough that no rounding can beat the
+    # grid point nearest to the optimum
+    radius = math.sqrt((smoothScore(optimum) - smoothScore(nearest) + 2 * roundingError) / curvature + 1e-9)
+    start = np.searchsorted(predictionsArray, optimum - radius, side="left")
+    end = np.searchsorted(predictionsArray, optimum + radius, side="right")
+
+    scores = self.getScores(player, currentPrediction, predictionsArray[start:end])
+    return selectBestPrediction(player.possiblePredictions[start:end], scores, maxScore)
+
+  def goldenSectionSearch(self, player, currentPrediction, maxScore):
+    predictionsArray = player.predictionsArray
+    scores = {}
+
+    def evaluate(indices):
+      indices = [i for i in indices if i not in scores]
+      if indices:
+        values = self.getScores(player, currentPrediction, predictionsArray[indices])
+        scores.update(zip(indices, values.tolist()))
+
+    lo = 0
+    hi = len(predictionsArray) - 1
+    while hi - lo > 3:
+      step = round((hi - lo) * (1 - INVERSE_GOLDEN_RATIO))
+      left = lo + step
+      right = hi - step
+      evaluate([left, right])
+
+      if scores[left] < scores[right]:
+        lo = left + 1
+      else:
+        hi = right - 1
+
+    # Finish with a scan of the final bracket and a small neighbourhood around its best point
+    evaluate(range(lo, hi + 1))
+    best = max(range(lo, hi + 1), key=lambda i: (scores[i], -i))
+    evaluate(range(max(0, best - self.refineRadius), min(len(predictionsArray), best + self.refineRadius + 1)))
+
+    # Certificate: evaluate whatever could still reach the incumbent score
+    incumbent = max(max(scores.values()), maxScore)
+    evaluate(np.flatnonzero(player.getScoreUpperBounds(self.players, currentPrediction) >= incumbent).tolist())
+
+    indices = sorted(scores)
+    return selectBestPrediction([player.possiblePredictions[i] for i in indices], [scores[i] for i in indices], maxScore)
+
+# MemoizedSolver that searches the grid coarse to fine instead of scanning all of it
+# The first level scans every prediction coarseDelta apart; each following level is
+# `refinement` times finer and only scans one coarser step around the `beam` best predictions
+# found so far, down to the grid's own delta. A grid of G predictions then costs about
+# (1 / coarseDelta) + 2 * beam * refinement scores per level instead of G. The last player
+# scores its whole grid in one vector call and keeps the exact scan
+# Unlike the other solvers this is an approximation: an optimum narrower than a coarse step
+# away from the coarse optimum can be missed (main.py --verify measures it). Its best
+# responses are therefore kept out of the persistent cache
+class MultiResolutionSolver(MemoizedSolver):
+  def __init__(self, players, cache=None, coarseDelta=0.1, refinement=10, beam=2):
+    super().__init__(players)
+    self.beam = beam
+    delta = players[0].possiblePredictions[1] - players[0].possiblePredictions[0]
+    self.strides = self.getStrides(max(1, round(coarseDelta / delta)), refinement)
+
+  # Index strides of each level on the full grid, e.g. [100, 10, 1] for delta=0.001
+  def getStrides(self, coarseStride, refinement):
+    strides = [coarseStride]
+    while strides[-1] > 1:
+      strides.append(max(1, strides[-1] // refinement))
+    return strides
+
+  def search(self, player, currentPrediction, maxScore):
+    if player.index == self.n - 1:
+      return super().search(player, currentPrediction, maxScore)
+
+    predictionsArray = player.predictionsArray
+    last = len(predictionsArray) - 1
+    scores = {}
+
+    def evaluate(indices):
+      indices = [i for i in indices if i not in scores]
+      if indices:
+        values = self.getScores(player, currentPrediction, predictionsArray[indices])
+        scores.update(zip(indices, values.tolist()))
+
+    evaluate(list(range(0, last + 1, self.strides[0])) + [last])
+    for previous, stride in zip(self.strides, self.strides[1:]):
+      steps = previous // stride
+      for best in sorted(scores, key=lambda i: (-scores[i], i))[:self.beam]:
+        evaluate([best + k * stride for k in range(-steps, steps + 1) if 0 <= best + k * stride <= last])
+
+    indices = sorted(scores)
+    return selectBestPrediction([player.possiblePredictions[i] for i in indices], [scores[i] for i in indices], maxScore)
+
+# MemoizedSolver seeded with the best responses of the previous q of a sweep
+# Equilibria barely move between neighbouring q, so a search first scores a window of `radius`
+# grid steps around the previous q's best response at the nearest partial sum. The window is
+# only trusted if no prediction outside it has an optimistic score
+# (Player.getScoreUpperBounds) that reaches the window's best; when one does, the warm start
+# failed and every such prediction is scored as well, so results stay exact. The last player
+# keeps its one-call full scan
+class WarmStartSolver(MemoizedSolver):
+  def __init__(self, players, cache=None, previous=None, radius=2):
+    super().__init__(players, cache)
+    self.radius = radius
+    self.searches = 0
+    self.fallbacks = 0
+    self.evaluated = 0
+    self.gridEvaluations = 0
+
+    # Previous best responses of each player, sorted by partial sum
+    self.hints = [None] * self.n
+    if previous is not None and previous.n == self.n:
+      for index, bestResponses in enumerate(previous.bestResponses):
+        if bestResponses:
+          partialSums = sorted(bestResponses)
+          self.hints[index] = (np.array(partialSums), [bestResponses[partialSum] for partialSum in partialSums])
+
+  def getHint(self, player, currentPrediction):
+    if self.hints[player.index] is None:
+      return player.p
+
+    partialSums, bestResponses = self.hints[player.index]
+    i = int(np.searchsorted(partialSums, currentPrediction))
+    if i == len(partialSums) or (i > 0 and currentPrediction - partialSums[i - 1] < partialSums[i] - currentPrediction):
+      i -= 1
+    return bestResponses[i]
+
+  def search(self, player, currentPrediction, maxScore):
+    if player.index == self.n - 1:
+      return super().search(player, currentPrediction, maxScore)
+
+    predictionsArray = player.predictionsArray
+    center = int(np.abs(predictionsArray - self.getHint(player, currentPrediction)).argmin())
+    window = np.arange(max(0, center - self.radius), min(len(predictionsArray), center + self.radius + 1))
+    scores = dict(zip(window.tolist(), self.getScores(player, currentPrediction, predictionsArray[window]).tolist()))
+
+    incumbent = max(max(scores.values()), maxScore)
+    outside = [i for i in np.flatnonzero(player.getScoreUpperBounds(self.players, currentPrediction) >= incumbent).tolist() if i not in scores]
+    if outside:
+      self.fallbacks += 1
+      scores.update(zip(outside, self.getScores(player, currentPrediction, predictionsArray[outside]).tolist()))
+
+    self.searches += 1
+    self.evaluated += len(scores)
+    self.gridEvaluations += len(predictionsArray)
+
+    indices = sorted(scores)
+    return selectBestPrediction([player.possiblePredictions[i] for i in indices], [scores[i] for i in indices], maxScore)
+
+  # Work done against what full scans of the same searches would have cost
+  def getReport(self):
+    return {
+      "searches": self.searches,
+      "fallbacks": self.fallbacks,
+      "evaluated": self.evaluated,
+      "gridEvaluations": self.gridEvaluations
+    }
+
+# Memoized engine for RelaxedInformationPlayer
+# A relaxed player scans its whole grid when it is the one predicting (top level) and only its
+# subset within radius of p when an earlier player simulates it (nested). Both are functions of
+# (index, partial sum), so each gets a memo table: every candidate of every earlier player that
+# leads to the same partial sum shares one nested solution instead of recursing again
+class RelaxedSolver(MemoizedSolver):
+  def __init__(self, players, cache=None):
+    self.players = players
+    self.n = len(players)
+    self.cache = cache
+    if cache is None:
+      self.bestResponses = [{True: {}, False: {}} for _ in range(self.n)]
+    else:
+      from .cache import getCacheKey
+      self.bestResponses = [{top_level: cache.getTable(getCacheKey(players, i, top_level)) for top_level in (True, False)} for i in range(self.n)]
+
+  def bestResponse(self, index, currentPrediction, top_level=True):
+    bestResponses = self.bestResponses[index][top_level]
+    hit = currentPrediction in bestResponses
+    if self.cache is not None:
+      self.cache.countLookup(hit)
+    if hit:
+      if stats.enabled:
+        stats.countCache(True)
+      return bestResponses[currentPrediction]
+
+    if stats.enabled:
+      stats.countCache(False)
+      stats.enterPredict(index)
+
+    player = self.players[index]
+    maxScore = calculateScore(0, f(currentPrediction, player.p), player.rule)
+    if top_level:
+      possiblePredictions, predictionsArray = player.possiblePredictions, player.predictionsArray
+    else:
+      possiblePredictions, predictionsArray = player.subset, player.subsetArray
+    scores = self.getScores(player, currentPrediction, predictionsArray)
+    bestPrediction = selectBestPrediction(possiblePredictions, scores, maxScore)
+
+    bestResponses[currentPrediction] = bestPrediction
+
+    if stats.enabled:
+      stats.exitPredict()
+    return bestPrediction
+
+  # Later players are always nested
+  def getFinalPredictions(self, player, currentPrediction, predictions):
+    if player.index == self.n - 1:
+      return currentPrediction + (player.weight * np.asarray(predictions, dtype=float))
+
+    finalPredictions = []
+    for prediction in np.asarray(predictions, dtype=float).tolist():
+      partialPrediction = currentPrediction + (player.weight * prediction)
+      finalPrediction = partialPrediction
+
+      for j in range(player.index + 1, self.n):
+        otherPrediction = self.bestResponse(j, partialPrediction, top_level=False) * self.players[j].weight
+        finalPrediction += otherPrediction
+
+      finalPredictions.append(finalPrediction)
+
+    return finalPredictions
+
+# MemoizedSolver without Python recursion, for markets deeper than the recursion limit
+# The backward induction runs on an explicit stack. A player only ever waits on later players,
+# so the stack holds at most one frame per player index, and frames are preallocated layers
+# indexed by player: the partial sum it responds to, the candidate and later player being
+# worked on, the final prediction built so far and a row of final predictions. Memory is the
+# memo tables plus those n layers whatever the depth; getMemoryReport sizes both
+class IterativeSolver(MemoizedSolver):
+  def __init__(self, players, cache=None):
+    super().__init__(players, cache)
+    self.stack = [0] * self.n
+    self.currentPredictions = [0.0] * self.n
+    self.maxScores = [0.0] * self.n
+    self.candidates = [0] * self.n
+    self.laterPlayers = [0] * self.n
+    self.partialPredictions = [0.0] * self.n
+    self.finalPrediction = [0.0] * self.n
+    self.finalPredictions = np.empty((self.n, max(len(player.possiblePredictions) for player in players)))
+    self.peakDepth = 0
+
+  def bestResponse(self, index, currentPrediction):
+    bestResponses = self.bestResponses[index]
+    hit = currentPrediction in bestResponses
+    if self.cache is not None:
+      self.cache.countLookup(hit)
+    if stats.enabled:
+      stats.countCache(hit)
+    if hit:
+      return bestResponses[currentPrediction]
+
+    depth = self.push(0, index, currentPrediction)
+    bestPrediction = None
+    while depth:
+      k = self.stack[depth - 1]
+      player = self.players[k]
+
+      if k == self.n - 1:
+        bestPrediction = self.search(player, self.currentPredictions[k], self.maxScores[k])
+      else:
+        if bestPrediction is not None:
+          # Response of the later player solved by the layer above
+          j = self.laterPlayers[k]
+          self.finalPrediction[k] += bestPrediction * self.players[j].weight
+          self.laterPlayers[k] = j + 1
+          bestPrediction = None
+
+        later = self.advance(k)
+        if later is not None:
+          depth = self.push(depth, *later)
+          continue
+
+        finalPredictions = self.finalPredictions[k, :len(player.possiblePredictions)]
+        scores = calculateScoreVector(player.predictionsArray, fVector(finalPredictions, player.p), player.rule)
+        bestPrediction = selectBestPrediction(player.possiblePredictions, scores, self.maxScores[k])
+
+      self.bestResponses[k][self.currentPredictions[k]] = bestPrediction
+      if stats.enabled:
+        stats.exitPredict()
+      depth -= 1
+
+    return bestPrediction
+
+  def push(self, depth, index, currentPrediction):
+    if stats.enabled:
+      stats.enterPredict(index)
+    player = self.players[index]
+    self.stack[depth] = index
+    self.currentPredictions[index] = currentPrediction
+    self.maxScores[index] = calculateScore(0, f(currentPrediction, player.p), player.rule)
+    self.startCandidate(index, 0)
+    self.peakDepth = max(self.peakDepth, depth + 1)
+    return depth + 1
+
+  # Every later player sees the same partial sum: the current one plus the candidate
+  def startCandidate(self, index, candidate):
+    player = self.players[index]
+    self.candidates[index] = candidate
+    if candidate < len(player.possiblePredictions):
+      self.partialPredictions[index] = self.currentPredictions[index] + (player.weight * player.possiblePredictions[candidate])
+      self.finalPrediction[index] = self.partialPredictions[index]
+      self.laterPlayers[index] = index + 1
+
+  # Adds the memoized responses of later players to the layer's final prediction until one is
+  # missing, and returns that player and its partial sum; None once every candidate is done
+  def advance(self, index):
+    candidates = len(self.players[index].possiblePredictions)
+    while self.candidates[index] < candidates:
+      j = self.laterPlayers[index]
+      if j == self.n:
+        self.finalPredictions[index, self.candidates[index]] = self.finalPrediction[index]
+        self.startCandidate(index, self.candidates[index] + 1)
+        continue
+
+      partialPrediction = self.partialPredictions[index]
+      hit = partialPrediction in self.bestResponses[j]
+      if self.cache is not None:
+        self.cache.countLookup(hit)
+      if stats.enabled:
+        stats.countCache(hit)
+      if not hit:
+        return j, partialPrediction
+
+      self.finalPrediction[index] += self.bestResponses[j][partialPrediction] * self.players[j].weight
+      self.laterPlayers[index] = j + 1
+    return None
+
+  # Deepest stack reached and sizes in bytes of the memo tables (dicts and their float keys and
+  # values, an upper bound since values are shared) and of the stack layers
+  def getMemoryReport(self):
+    entries = sum(len(bestResponses) for bestResponses in self.bestResponses)
+    layers = [self.stack, self.currentPredictions, self.maxScores, self.candidates, self.laterPlayers, self.partialPredictions, self.finalPrediction]
+    return {
+      "peakDepth": self.peakDepth,
+      "tableEntries": entries,
+      "tableBytes": sum(sys.getsizeof(bestResponses) for bestResponses in self.bestResponses) + 2 * entries * sys.getsizeof(0.0),
+      "stackBytes": self.finalPredictions.nbytes + sum(sys.getsizeof(layer) + len(layer) * sys.getsizeof(0.0) for layer in layers)
+    }
@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import os
+import shutil
+import sqlite3
+
+import numpy as np
+
+from .utils import predictionGrid
+
+# Fields of a record stored as columns; the statistics of replication runs add one column per
+# summary, e.g. "predictions.mean" or "score.quantile_0.5"
+FIELDS = ["scores", "predictions", "finalPrediction", "marketPrediction", "score"]
+
+# Columnar store for many runs
+# Every run is a directory of .npy files, one per column with one row per q, opened
+# memory-mapped so a query only reads the pages of the slices it touches. An SQLite index holds
+# each run's config, so runs are filtered by any config field without opening their arrays
+#
+#   store = ResultStore()
+#   for run in store.query(n=4, noise_function="gaussian"):
+#     run.select(0.2, 0.8)["marketPrediction"]
+class ResultStore:
+  def __init__(self, path="results/store"):
+    self.path = path
+    os.makedirs(path, exist_ok=True)
+    self.connection = sqlite3.connect(os.path.join(path, "index.sqlite"), timeout=60, isolation_level=None)
+    self.connection.execute("PRAGMA journal_mode=WAL")
+    self.connection.execute("CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, config TEXT, rows INTEGER, columns TEXT)")
+    for field in ["n", "player_type", "noise_function", "solver"]:
+      self.connection.execute(f"CREATE INDEX IF NOT EXISTS runs_{field} ON runs (json_extract(config, '$.{field}'))")
+
+  # Stores the records of a run (as streamed by JSONLinesResultHandler, in floats) under its name
+  # Arrays are written to a temporary directory and moved in place, so readers never see a
+  # partial run; writing a run again replaces it
+  def write(self, run, config, records):
+    columns = records_to_columns(records)
+    directory = os.path.join(self.path, run)
+    staging = f"{directory}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, values in columns.items():
+      np.save(os.path.join(staging, f"{name}.npy"), values)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.rename(staging, directory)
+    self.connection.execute(
+      "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?)",
+      (run, json.dumps(config), len(records), json.dumps(list(columns)))
+    )
+
+  # Runs whose config has every given field equal to the given value, e.g. query(n=4, radius=2)
+  # A list or tuple value matches any of its elements
+  def query(self, **filters):
+    conditions = []
+    parameters = []
+    for field, value in filters.items():
+      # Fields are written into the SQL so the indexed ones match their expression index
+      if not field.isidentifier():
+        raise ValueError(f"invalid config field: {field!r}")
+      values = value if isinstance(value, (list, tuple)) else [value]
+      conditions.append(f"json_extract(config, '$.{field}') IN ({', '.join('?' * len(values))})")
+      parameters.extend(values)
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = self.connection.execute(f"SELECT run, config, rows, columns FROM runs{where} ORDER BY run", parameters).fetchall()
+    return [StoredRun(os.path.join(self.path, run), run, json.loads(config), rows, json.loads(columns)) for run, config, rows, columns in rows]
+
+  def get(self, run):
+    row = self.connection.execute("SELECT run, config, rows, columns FROM runs WHERE run = ?", (run,)).fetchone()
+    if row is None:
+      raise KeyError(run)
+    return StoredRun(os.path.join(self.path, row[0]), row[0], json.loads(row[1]), row[2], json.loads(row[3]))
+
+  def remove(self, run):
+    self.connection.execute("DELETE FROM runs WHERE run = ?", (run,))
+    shutil.rmtree(os.path.join(self.path, run), ignore_errors=True)
+
+  def close(self):
+    self.connection.close()
+
+# One run of a ResultStore; columns are opened memory-mapped on first access
+class StoredRun:
+  def __init__(self, path, run, config, rows, columns):
+    self.path = path
+    self.run = run
+    self.config = config
+    self.rows = rows
+    self.columns = columns
+    self.arrays = {}
+
+  def __getitem__(self, column):
+    if column not in self.arrays:
+      if column not in self.columns:
+        raise KeyError(f"run {self.run} has no column {column}; columns: {self.columns}")
+      self.arrays[column] = np.load(os.path.join(self.path, f"{column}.npy"), mmap_mode="r")
+    return self.arrays[column]
+
+  # Rows with qMin <= q <= qMax of the given columns (all by default), as memory-mapped views
+  def select(self, qMin=0, qMax=1, columns=None):
+    q = self["q"]
+    start = int(np.searchsorted(q, qMin, side="left"))
+    end = int(np.searchsorted(q, qMax, side="right"))
+    return {column: self[column][start:end] for column in (columns or self.columns)}
+
+  def __repr__(self):
+    return f"StoredRun({self.run!r}, rows={self.rows}, config={self.config})"
+
+# Columns of a list of records, sorted by q
+def records_to_columns(records):
+  records = sorted(records, key=lambda record: record["q"])
+  columns = {"q": np.array([record["q"] for record in records], dtype=float)}
+
+  for field in ["beliefs"] + FIELDS:
+    if not records or field not in records[0]:
+      continue
+    if isinstance(records[0][field], dict):
+      # Statistics of replication runs
+      for summary in ["mean", "variance"]:
+        columns[f"{field}.{summary}"] = np.array([record[field][summary] for record in records], dtype=float)
+      for quantile in records[0][field].get("quantiles", {}):
+        columns[f"{field}.quantile_{quantile}"] = np.array([record[field]["quantiles"][quantile] for record in records], dtype=float)
+    else:
+      columns[field] = np.array([record[field] for record in records], dtype=float)
+
+  return columns
+
+# Records of a JSON written by JSONResultHandler
+# Single runs don't store their q values; they are the q grid of the config's deltaQ
+def read_json_results(filename):
+  with open(filename, "r") as json_file:
+    results = json.load(json_file)
+  config = results["config"]
+
+  if "statistics" in results:
+    statistics = results["statistics"]
+    records = []
+    for i, q in enumerate(statistics["q"]):
+      record = {"q": q}
+      for field in ["beliefs"] + FIELDS:
+        summaries = statistics[field]
+        record[field] = {summary: summaries[summary][i] for summary in ["mean", "variance"]}
+        if "quantiles" in summaries:
+          record[field]["quantiles"] = {quantile: values[i] for quantile, values in summaries["quantiles"].items()}
+      records.append(record)
+    return config, records
+
+  qValues = predictionGrid(config.get("deltaQ", 0.05))
+  if len(qValues) != len(results["scores"]):
+    raise ValueError(f"{filename} has {len(results['scores'])} rows, but deltaQ = {config.get('deltaQ')} gives {len(qValues)} q values")
+  records = [{"q": q, **{field: results[field][i] for field in FIELDS}} for i, q in enumerate(qValues)]
+  return config, records
+
+# Records of the scores and predictions CSVs written by CSVResultHandler
+# The CSVs have no config, so it is given by the caller; n is taken from the header
+def read_csv_results(scores_file, predictions_file, config=None):
+  with open(scores_file, "r", newline="") as scores_csv, open(predictions_file, "r", newline="") as predictions_csv:
+    scores_rows = list(csv.DictReader(scores_csv))
+    predictions_rows = list(csv.DictReader(predictions_csv))
+
+  n = sum(1 for column in scores_rows[0] if column.startswith("p")) if scores_rows else 0
+  records = []
+  for scores_row, predictions_row in zip(scores_rows, predictions_rows):
+    records.append({
+      "q": float(scores_row["q"]),
+      "scores": [float(scores_row[f"p{i + 1}"]) for i in range(n)],
+      "predictions": [float(predictions_row[f"p{i + 1}"]) for i in range(n)],
+      "finalPrediction": float(predictions_row["final"]),
+      "marketPrediction": float(predictions_row["market"]),
+      "score": float(scores_row["market"])
+    })
+  return {"n": n, **(config or {})}, records
+
+# Run name of a result file: its name without the directory and suffix
+def run_name(filename):
+  return os.path.splitext(os.path.basename(filename))[0]
+
+# Run name and kind of a CSV written by CSVResultHandler (<run>-scores.csv, <run>-predictions.csv)
+# The unnamed scores.csv / predictions.csv of old runs are named after their directory
+def csv_run(filename):
+  name = run_name(filename)
+  for kind in ["scores", "predictions"]:
+    if name == kind:
+      return os.path.basename(os.path.dirname(os.path.abspath(filename))), kind
+    if name.endswith(f"-{kind}"):
+      return name[:-len(kind) - 1], kind
+  raise ValueError(f"{filename} is neither a scores nor a predictions CSV")
+
+# Converts JSON results and pairs of scores/predictions CSVs into the store
+def convert(store, filenames, config=None):
+  converted = []
+  csv_pairs = {}
+  for filename in filenames:
+    if filename.endswith(".json"):
+      run_config, records = read_json_results(filename)
+      store.write(run_name(filename), run_config, records)
+      converted.append(run_name(filename))
+    elif filename.endswith(".csv"):
+      run, kind = csv_run(filename)
+      csv_pairs.setdefault(run, {})[kind] = filename
+
+  for run, pair in csv_pairs.items():
+    if set(pair) != {"scores", "predictions"}:
+      raise ValueError(f"{run}: a CSV run needs both its scores and predictions files, got {list(pair.values())}")
+    run_config, records = read_csv_results(pair["scores"], pair["predictions"], config)
+    store.write(run, run_config, records)
+    converted.append(run)
+
+  return converted
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Convert results into the columnar result store and query it.")
+  parser.add_argument("--store", type=str, default="results/store", help="Directory of the store")
+  subparsers = parser.add_subparsers(dest="command", required=True)
+
+  convert_parser = subparsers.add_parser("convert", help="Add JSON results and scores/predictions CSV pairs to the store")
+  convert_parser.add_argument("files", nargs="+", help="Result files; CSVs are paired by run name")
+  convert_parser.add_argument("--config", type=str, help="JSON config of the CSV runs, which don't store one")
+
+  query_parser = subparsers.add_parser("query", help="List the runs whose config matches every field=value")
+  query_parser.add_argument("filters", nargs="*", help="Config filters, e.g. n=4 noise_function=gaussian (values are parsed as JSON when possible)")
+
+  args = parser.parse_args()
+  store = ResultStore(args.store)
+
+  if args.command == "convert":
+    converted = convert(store, args.files, json.loads(args.config) if args.config else None)
+    print(f"Converted {len(converted)} runs into {args.store}")
+  else:
+    filters = {}
+    for item in args.filters:
+      field, _, value = item.partition("=")
+      try:
+        filters[field] = json.loads(value)
+      except json.JSONDecodeError:
+        filters[field] = value
+    for run in store.query(**filters):
+      print(run)
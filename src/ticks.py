@@ -0,0 +1,138 @@
+from fractions import Fraction
+import math
+import numpy as np
+
+from .rules import calculateScoreVector, fVector
+
+# f rounds the final probability to 2 decimals, so it always lives on a grid of 0.01
+FINAL_RESOLUTION = 100
+
+# Fixed-point representation of a market
+# A prediction is an integer number of ticks of 1 / resolution, a weight an integer number of
+# ticks of 1 / weightResolution, and a partial market sum the integer sum of their products
+# (ticks of 1 / (resolution * weightResolution)). Sums are exact, so two partial sums are
+# equal exactly when the markets are, and they can be used directly as table indices
+class TickGrid:
+  def __init__(self, delta, weights, maxDenominator=10000):
+    self.resolution = round(1 / delta)
+    if not math.isclose(self.resolution * delta, 1):
+      raise ValueError(f"delta = {delta} doesn't divide [0, 1] into whole ticks")
+
+    fractions = [Fraction(weight).limit_denominator(maxDenominator) for weight in weights]
+    if any(not math.isclose(fraction, weight) for fraction, weight in zip(fractions, weights)):
+      raise ValueError(f"weights {weights} have no exact tick representation")
+
+    self.weightResolution = math.lcm(*(fraction.denominator for fraction in fractions))
+    self.weightTicks = [int(fraction * self.weightResolution) for fraction in fractions]
+    self.sumResolution = self.resolution * self.weightResolution
+    self.maxSum = sum(self.weightTicks) * self.resolution
+
+    self.finalTables = {}
+    self.scoreTables = {}
+
+  @classmethod
+  def fromPlayers(cls, players):
+    delta = 1 / (len(players[0].possiblePredictions) - 1)
+    return cls(delta, [player.weight for player in players])
+
+  # Tick of f(partial sum, p) for every partial sum
+  # f itself is still the float function of rules.py, evaluated once per exact partial sum, so
+  # the rounding of values on a .005 boundary is the one the float engines use
+  def getFinalTable(self, p):
+    if p not in self.finalTables:
+      sums = np.arange(self.maxSum + 1) / self.sumResolution
+      self.finalTables[p] = np.rint(fVector(sums, p) * FINAL_RESOLUTION).astype(np.int64)
+    return self.finalTables[p]
+
+  # Score of every prediction tick against every final probability tick
+  def getScoreTable(self, rule):
+    if rule not in self.scoreTables:
+      predictions = np.arange(self.resolution + 1) / self.resolution
+      finals = np.arange(FINAL_RESOLUTION + 1) / FINAL_RESOLUTION
+      self.scoreTables[rule] = calculateScoreVector(predictions[:, None], finals[None, :], rule)
+    return self.scoreTables[rule]
+
+  def toPrediction(self, tick):
+    return tick / self.resolution
+
+  def toMarketPrediction(self, tick):
+    return tick / self.sumResolution
+
+  def toFinalPrediction(self, tick):
+    return tick / FINAL_RESOLUTION
+
+  def fromMarketPrediction(self, value):
+    return int(round(value * self.sumResolution))
+
+  # Converts a record written by TickSolver (ticks) back to floats
+  def toFloats(self, record):
+    record = dict(record)
+    record["predictions"] = [self.toPrediction(tick) for tick in record["predictions"]]
+    record["finalPrediction"] = self.toFinalPrediction(record["finalPrediction"])
+    record["marketPrediction"] = self.toMarketPrediction(record["marketPrediction"])
+    return record
+
+# Backward induction for PerfectInformationPlayer over integer ticks
+# A best response only depends on the player and the partial sum, which is now a small integer,
+# so each player's best responses are a dense array indexed by partial sum and are all solved
+# up front, from the last player to the first, with table lookups instead of f and the rules
+class TickSolver:
+  def __init__(self, players, grid=None):
+    self.players = players
+    self.n = len(players)
+    self.grid = grid or TickGrid.fromPlayers(players)
+    self.bestResponses = self.solve()
+
+  def solve(self):
+    grid = self.grid
+    weightTicks = grid.weightTicks
+    predictionTicks = np.arange(grid.resolution + 1)
+    bestResponses = [None] * self.n
+
+    for j in reversed(range(self.n)):
+      player = self.players[j]
+      finalTable = grid.getFinalTable(player.p)
+      scoreTable = grid.getScoreTable(player.rule)
+
+      # Partial sums player j can face and the ones each of its predictions leads to
+      sums = np.arange(sum(weightTicks[:j]) * grid.resolution + 1)
+      partialSums = sums[:, None] + weightTicks[j] * predictionTicks[None, :]
+
+      # Later players all respond to the same partial sum
+      finalSums = partialSums.copy()
+      for k in range(j + 1, self.n):
+        finalSums += weightTicks[k] * bestResponses[k][partialSums]
+
+      scores = scoreTable[predictionTicks[None, :], finalTable[finalSums]]
+      maxScores = scoreTable[0, finalTable[sums]]
+
+      # First best prediction, kept only if it beats predicting 0 without looking ahead
+      best = np.argmax(scores, axis=1)
+      bestScores = scores[sums, best]
+      bestResponses[j] = np.where(bestScores > maxScores, best, 0)
+
+    return bestResponses
+
+  # Float interface used by simulate()
+  def bestResponse(self, index, currentPrediction):
+    tick = self.bestResponses[index][self.grid.fromMarketPrediction(currentPrediction)]
+    return self.grid.toPrediction(int(tick))
+
+  def predict(self, player, predictions):
+    currentPrediction = player.getCurrentPrediction(self.players, predictions)
+    return self.bestResponse(player.index, currentPrediction)
+
+  # Plays the market in ticks: prediction ticks, final probability tick, market sum tick
+  # Scores are read from the score tables and are the only floats
+  def simulate(self, q):
+    grid = self.grid
+    predictions = []
+    marketPrediction = 0
+    for j in range(self.n):
+      prediction = int(self.bestResponses[j][marketPrediction])
+      predictions.append(prediction)
+      marketPrediction += grid.weightTicks[j] * prediction
+
+    finalPrediction = int(grid.getFinalTable(q)[marketPrediction])
+    scores = [grid.getScoreTable(player.rule)[predictions[j], finalPrediction].item() for j, player in enumerate(self.players)]
+    return scores, predictions, finalPrediction, marketPrediction
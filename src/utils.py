@@ -1,3 +1,6 @@
+from decimal import Decimal
+import math
+import numpy as np
 import random
 
 def randomRules(n):
@@ -8,4 +11,14 @@ def equalRules(n, rule):
   return [rule] * n
 
 def equalWeights(n):
-  return [1/n] * n
\ No newline at end of file
+  return [1/n] * n
+# Predictions 0, delta, ..., 1 rounded to the decimals of delta (at least 2, like f)
+# delta must divide [0, 1] into whole steps, as in TickGrid; any other step would be changed
+def predictionGrid(delta):
+  if not isGridStep(delta):
+    raise ValueError(f"delta = {delta} doesn't divide [0, 1] into whole steps")
+  decimals = max(2, -Decimal(str(delta)).as_tuple().exponent)
+  return np.linspace(0, 1, round(1 / delta) + 1).round(decimals).tolist()
+
+def isGridStep(delta):
+  return 0 < delta <= 1 and math.isclose(round(1 / delta) * delta, 1)
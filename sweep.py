@@ -0,0 +1,248 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import main
+import runner
+
+# Values every config starts from, as with the main.py defaults
+DEFAULTS = {
+  **main.config,
+  "noise_function": "identity",
+  "noise_delta": 0.01,
+  "solver": "memoized",
+  "workers": 1
+}
+
+# Keys whose value is a list in a single config, so a list there is not a grid axis
+LIST_KEYS = {"quantiles", "belief_values", "belief_probabilities"}
+
+# Grid file: a JSON object of config keys, where a list gives the values of an axis
+# Example: {"n": [3, 4, 5], "player_type": "perfect", "noise_function": ["gaussian", "uniform"], "noise_delta": [0.01, 0.05]}
+def expand_grid(grid):
+  axes = {key: value for key, value in grid.items() if isinstance(value, list) and key not in LIST_KEYS}
+  fixed = {key: value for key, value in grid.items() if key not in axes}
+
+  configs = []
+  for values in itertools.product(*axes.values()):
+    config = {**DEFAULTS, **fixed, **dict(zip(axes, values))}
+    if "player_type" not in config:
+      raise ValueError("player_type is required in the grid")
+    if config["player_type"] == "relaxed" and config.get("radius") is None:
+      raise ValueError("radius is required for RelaxedInformationPlayer")
+    if config["player_type"] == "meanfield":
+      config.setdefault("lookahead", 1)
+    if config["player_type"] == "average":
+      config.setdefault("belief", "uniform")
+      if config["belief"] == "discrete" and "belief_values" not in config:
+        raise ValueError("belief_values is required for a discrete belief")
+      if config["belief"] != "discrete":
+        config.setdefault("belief_spread", 0.05)
+        config.setdefault("belief_points", 11)
+    if config.get("replications"):
+      config.setdefault("quantiles", [0.05, 0.25, 0.5, 0.75, 0.95])
+    configs.append(config)
+  return configs, list(axes)
+
+def config_id(config):
+  return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+# Work queue shared by every process (and machine) draining the same sweep
+# A job is claimed by marking it running with an owner and a start time, which the owner renews
+# while it runs; a running job whose lease expired is assumed to belong to a dead worker and is
+# handed out again. Jobs resume their own JSON Lines file, so a reclaimed config only solves
+# the q values still missing
+class WorkQueue:
+  def __init__(self, path):
+    self.path = path
+    self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+    # Rollback journal, not WAL: WAL keeps its index in shared memory, which processes on other
+    # machines sharing the file can't see. Claims are serialized by BEGIN IMMEDIATE
+    self.connection.execute("PRAGMA journal_mode=DELETE")
+    self.connection.execute(
+      "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, config TEXT, status TEXT, owner TEXT, "
+      "started REAL, finished REAL, attempts INTEGER, error TEXT)"
+    )
+
+  def add(self, configs):
+    self.connection.executemany(
+      "INSERT OR IGNORE INTO jobs (id, config, status, attempts) VALUES (?, ?, 'pending', 0)",
+      [(config_id(config), json.dumps(config)) for config in configs]
+    )
+
+  def claim(self, owner, lease):
+    self.connection.execute("BEGIN IMMEDIATE")
+    row = self.connection.execute(
+      "SELECT id, config FROM jobs WHERE status = 'pending' OR (status = 'running' AND started < ?) ORDER BY rowid LIMIT 1",
+      (time.time() - lease,)
+    ).fetchone()
+    if row is not None:
+      self.connection.execute(
+        "UPDATE jobs SET status = 'running', owner = ?, started = ?, attempts = attempts + 1 WHERE id = ?",
+        (owner, time.time(), row[0])
+      )
+    self.connection.execute("COMMIT")
+    return (row[0], json.loads(row[1])) if row else None
+
+  # Extends the lease of a running job; False once the job was handed to another owner
+  def renew(self, job, owner):
+    cursor = self.connection.execute(
+      "UPDATE jobs SET started = ? WHERE id = ? AND owner = ? AND status = 'running'",
+      (time.time(), job, owner)
+    )
+    return cursor.rowcount == 1
+
+  # Only the current owner finishes a job, so a worker whose job was reclaimed can't overwrite
+  # the status of the new owner
+  def finish(self, job, owner, error=None):
+    status = "failed" if error else "done"
+    cursor = self.connection.execute(
+      "UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ? AND owner = ? AND status = 'running'",
+      (status, time.time(), error, job, owner)
+    )
+    return cursor.rowcount == 1
+
+  def retry_failed(self):
+    self.connection.execute("UPDATE jobs SET status = 'pending', error = NULL WHERE status = 'failed'")
+
+  def counts(self):
+    return dict(self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+  def jobs(self):
+    return [(job, json.loads(config), status) for job, config, status in self.connection.execute("SELECT id, config, status FROM jobs ORDER BY rowid")]
+
+def output_name(name, job):
+  return f"{name}-{job}"
+
+# Lease of a claimed job while its config runs, renewed every quarter lease from its own thread
+# and connection, so a single q longer than the lease keeps its job
+class Lease:
+  def __init__(self, queue_path, job, owner, duration):
+    self.queue_path = queue_path
+    self.job = job
+    self.owner = owner
+    self.duration = duration
+    self.renewed = time.time()
+    self.revoked = threading.Event()
+    self.done = threading.Event()
+    self.thread = threading.Thread(target=self.keep_alive, daemon=True)
+    self.thread.start()
+
+  def keep_alive(self):
+    queue = WorkQueue(self.queue_path)
+    while not self.done.wait(self.duration / 4):
+      if not queue.renew(self.job, self.owner):
+        self.revoked.set()
+        break
+      self.renewed = time.time()
+    queue.connection.close()
+
+  # True once the job may belong to another worker: its renewal failed, or it wasn't renewed
+  # for a whole lease (e.g. this process was suspended), so it may have been reclaimed before
+  # the next renewal gets to find out
+  def lost(self):
+    return self.revoked.is_set() or time.time() - self.renewed >= self.duration
+
+  def release(self):
+    self.done.set()
+    self.thread.join()
+
+# Solves claimed configs until the queue is empty; runs inside each worker process
+def drain(queue_path, name, lease):
+  queue = WorkQueue(queue_path)
+  owner = f"{socket.gethostname()}:{os.getpid()}"
+  solved = 0
+
+  while (claimed := queue.claim(owner, lease)) is not None:
+    job, config = claimed
+    config["output"] = output_name(name, job)
+    config["resume"] = True
+    if config.get("seed") is None:
+      # Fixed per config, so a reclaimed job keeps drawing the same beliefs
+      config["seed"] = int(job, 16)
+
+    claim = Lease(queue_path, job, owner, lease)
+    failure = None
+    try:
+      # A run whose job was reclaimed stops and leaves the job and its files to the new owner
+      runner.execute(config, cancel=claim.lost)
+    except Exception as error:
+      failure = repr(error)
+    finally:
+      claim.release()
+
+    if claim.lost() or not queue.finish(job, owner, failure):
+      print(f"Config {job} was handed to another worker")
+    elif failure:
+      print(f"Config {job} failed: {failure}")
+    else:
+      solved += 1
+
+  return solved
+
+# One JSON for the whole sweep: every finished config and its results, plus an index from
+# each grid axis value to the configs that have it
+def merge(queue, name, axes, filename):
+  configs = {}
+  results = {}
+  index = {axis: {} for axis in axes}
+
+  for job, config, status in queue.jobs():
+    if status != "done":
+      continue
+    with open(f"results/{output_name(name, job)}.json", "r") as json_file:
+      results[job] = json.load(json_file)
+    configs[job] = results[job].pop("config")
+    for axis in axes:
+      index[axis].setdefault(str(config.get(axis)), []).append(job)
+
+  with open(filename, "w") as json_file:
+    json.dump({"axes": axes, "index": index, "configs": configs, "results": results}, json_file, indent=2)
+  return len(results)
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Run every config of a parameter grid through a shared work queue.")
+  parser.add_argument("grid", type=str, help="JSON file of config keys; lists are expanded as a Cartesian product")
+  parser.add_argument("--name", type=str, help="Name of the sweep in results/ (defaults to the grid file name)")
+  parser.add_argument("--workers", type=int, default=1, help="Number of processes draining the queue on this machine")
+  parser.add_argument("--lease", type=float, default=3600, help="Seconds after which a running config is assumed dead and handed out again")
+  parser.add_argument("--retry_failed", action="store_true", help="Queue the configs that failed in a previous run again")
+  parser.add_argument("--log_level", type=str, choices=["DEBUG", "INFO", "WARNING", "ERROR"], default="WARNING", help="Log level of the runs of each config")
+  parser.add_argument("--merge_only", action="store_true", help="Only write the merged output of the configs finished so far")
+
+  args = parser.parse_args()
+  logging.basicConfig(level=args.log_level, format="%(message)s", stream=sys.stdout)
+
+  name = args.name or os.path.splitext(os.path.basename(args.grid))[0]
+  with open(args.grid, "r") as grid_file:
+    configs, axes = expand_grid(json.load(grid_file))
+
+  os.makedirs("results", exist_ok=True)
+  queue_path = f"results/{name}.queue.sqlite"
+  queue = WorkQueue(queue_path)
+  queue.add(configs)
+  if args.retry_failed:
+    queue.retry_failed()
+
+  print(f"Sweep {name}: {len(configs)} configs over {axes}; queue {queue.counts()}")
+
+  start_time = time.time()
+  if not args.merge_only:
+    if args.workers > 1:
+      with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        solved = sum(executor.map(drain, [queue_path] * args.workers, [name] * args.workers, [args.lease] * args.workers))
+    else:
+      solved = drain(queue_path, name, args.lease)
+    print(f"Solved {solved} configs in {time.time() - start_time:.2f} seconds; queue {queue.counts()}")
+
+  merged = merge(queue, name, axes, f"results/{name}.json")
+  print(f"Merged {merged} finished configs into results/{name}.json")